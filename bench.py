@@ -0,0 +1,274 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Benchmark extract, compile and the round trip test on a generated layout.
+# Each stage is run as a separate process and its wall time and peak memory
+# (maximum resident set size) are recorded. The results can be saved as a
+# baseline, and later runs are compared with the baseline to find regressions.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+
+# The number of objects of each kind, as a multiple of --scale
+scaleFactors = {
+    'sensors': 1.0, # Per connection type: CMRI, Loconet and internal
+    'turnouts': 1.0, # Per connection type: CMRI and Loconet
+    'lights': 1.0,
+    'reporters': 0.2,
+    'tripleHeads': 0.5,
+    'singleHeads': 0.5,
+    'masts': 1.0,
+    'blocks': 1.0,
+    'panelItems': 4.0, # Items in the layout editor panel, which is not managed
+    }
+
+sensorManagers = [
+    ('CS', 'jmri.jmrix.cmri.serial.configurexml.SerialSensorManagerXml'),
+    ('LS', 'jmri.jmrix.loconet.configurexml.LnSensorManagerXml'),
+    ('IS', 'jmri.managers.configurexml.InternalSensorManagerXml'),
+    ]
+
+turnoutManagers = [
+    ('CT', 'jmri.jmrix.cmri.serial.configurexml.SerialTurnoutManagerXml'),
+    ('LT', 'jmri.jmrix.loconet.configurexml.LnTurnoutManagerXml'),
+    ]
+
+# Write a layout file with the given number of objects of each kind
+def generateLayout(fileName, counts):
+    numSensors = counts['sensors']
+    numTurnouts = counts['turnouts']
+    with open(fileName, 'w', encoding='UTF-8') as outFile:
+        w = outFile.write
+        w('<?xml version="1.0" encoding="UTF-8"?>\n')
+        w('<?xml-stylesheet type="text/xsl" href="/xml/XSLT/panelfile-4-19-2.xsl"?>\n')
+        w('<layout-config xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://jmri.org/xml/schema/layout-4-19-2.xsd">\n')
+        w('  <jmriversion>\n    <major>4</major>\n    <minor>22</minor>\n  </jmriversion>\n')
+        for (prefix, className) in sensorManagers:
+            w('  <sensors class="%s">\n' % className)
+            w('    <defaultInitialState>unknown</defaultInitialState>\n')
+            if prefix == 'CS':
+                w('    <globalDebounceTimers>\n      <goingActive>250</goingActive>\n      <goingInActive>250</goingInActive>\n    </globalDebounceTimers>\n')
+            for i in range(1, numSensors + 1):
+                w('    <sensor inverted="%s">\n      <systemName>%s%d</systemName>\n' % ('true' if i % 5 == 0 else 'false', prefix, i))
+                if i % 3:
+                    w('      <userName>%s sensor %d</userName>\n' % (prefix, i))
+                if i % 4 == 0:
+                    w('      <comment>Sensor &amp; comment %d</comment>\n' % i)
+                if prefix == 'CS':
+                    w('      <useGlobalDebounceTimer>true</useGlobalDebounceTimer>\n')
+                w('    </sensor>\n')
+            w('  </sensors>\n')
+        for (prefix, className) in turnoutManagers:
+            w('  <turnouts class="%s">\n' % className)
+            w('    <operations automate="false">\n')
+            w('      <operation name="NoFeedback" class="jmri.configurexml.turnoutoperations.NoFeedbackTurnoutOperationXml" interval="300" maxtries="2" />\n')
+            w('    </operations>\n')
+            w('    <defaultclosedspeed>Normal</defaultclosedspeed>\n    <defaultthrownspeed>Restricted</defaultthrownspeed>\n')
+            for i in range(1, numTurnouts + 1):
+                feedback = 'ONESENSOR' if i % 2 else 'DIRECT'
+                sensors = ' sensor1="CS%d"' % min(i, numSensors) if i % 2 and numSensors else ''
+                w('    <turnout feedback="%s"%s inverted="false" automate="Off">\n      <systemName>%s%d</systemName>\n' % (feedback, sensors, prefix, i))
+                if i % 2:
+                    w('      <userName>%s turnout %d</userName>\n' % (prefix, i))
+                if prefix == 'LT':
+                    w('      <properties>\n        <property>\n          <key>Send ON/OFF</key>\n')
+                    w('          <value class="java.lang.Boolean">false</value>\n        </property>\n      </properties>\n')
+                w('    </turnout>\n')
+            w('  </turnouts>\n')
+        w('  <lights class="jmri.jmrix.cmri.serial.configurexml.SerialLightManagerXml">\n')
+        for i in range(1, counts['lights'] + 1):
+            w('    <light minIntensity="0.0" maxIntensity="1.0" transitionTime="0.0">\n      <systemName>CL%d</systemName>\n' % i)
+            if i % 2 and numSensors:
+                w('      <lightcontrol controlType="1" controlSensor="CS%d" sensorSense="2" />\n' % min(i, numSensors))
+            w('    </light>\n')
+        w('  </lights>\n')
+        w('  <reporters class="jmri.jmrix.loconet.configurexml.LnReporterManagerXml">\n')
+        for i in range(1, counts['reporters'] + 1):
+            w('    <reporter>\n      <systemName>LR%d</systemName>\n      <userName>Reporter %d</userName>\n    </reporter>\n' % (i, i))
+        w('  </reporters>\n')
+        w('  <memories class="jmri.managers.configurexml.DefaultMemoryManagerXml">\n')
+        w('    <memory value="12:00 PM">\n      <systemName>IMCURRENTTIME</systemName>\n    </memory>\n  </memories>\n')
+        w('  <signalheads class="jmri.managers.configurexml.AbstractSignalHeadManagerXml">\n')
+        numHeads = 0
+        def turnout(i):
+            return 'CT%d' % (i % max(numTurnouts, 1) + 1)
+        for i in range(counts['tripleHeads']):
+            numHeads += 1
+            w('    <signalhead class="jmri.implementation.configurexml.TripleTurnoutSignalHeadXml">\n')
+            w('      <systemName>IH%d</systemName>\n      <userName>Head %d</userName>\n' % (numHeads, numHeads))
+            for (j, color) in enumerate([ 'green', 'yellow', 'red' ]):
+                w('      <turnoutname defines="%s">%s</turnoutname>\n' % (color, turnout(3 * i + j)))
+            w('    </signalhead>\n')
+        for i in range(counts['singleHeads']):
+            numHeads += 1
+            w('    <signalhead class="jmri.implementation.configurexml.SingleTurnoutSignalHeadXml">\n')
+            w('      <systemName>IH%d</systemName>\n' % numHeads)
+            w('      <appearance defines="thrown">4</appearance>\n      <appearance defines="closed">16</appearance>\n')
+            w('      <turnoutname defines="aspect">%s</turnoutname>\n    </signalhead>\n' % turnout(i))
+        w('  </signalheads>\n')
+        w('  <signalmasts class="jmri.managers.configurexml.DefaultSignalMastManagerXml">\n')
+        for i in range(1, counts['masts'] + 1):
+            if i % 4 == 0:
+                w('    <virtualsignalmast class="jmri.implementation.configurexml.VirtualSignalMastXml">\n')
+                w('      <systemName>IF$vsm:AAR-1946:SL-1-high-abs($%04d)</systemName>\n' % i)
+            else:
+                w('    <signalmast class="jmri.implementation.configurexml.SignalHeadSignalMastXml">\n')
+                w('      <systemName>IF$shsm:AAR-1946:SL-1-high-abs(IH%d)</systemName>\n      <userName>Mast %d</userName>\n' % (i, i))
+            w('      <unlit allowed="no" />\n')
+            if i % 3 == 0:
+                w('      <disabledAspects>\n        <disabledAspect>Clear</disabledAspect>\n')
+                w('        <disabledAspect>Approach Medium</disabledAspect>\n      </disabledAspects>\n')
+            w('    </%s>\n' % ('virtualsignalmast' if i % 4 == 0 else 'signalmast'))
+        w('  </signalmasts>\n')
+        w('  <blocks class="jmri.configurexml.BlockManagerXml">\n    <defaultspeed>Normal</defaultspeed>\n')
+        numBlocks = counts['blocks']
+        for i in range(1, numBlocks + 1):
+            w('    <block systemName="IB%d">\n      <systemName>IB%d</systemName>\n' % (i, i))
+            if i % 2:
+                w('      <userName>IB%d</userName>\n' % i)
+            w('    </block>\n')
+        for i in range(1, numBlocks + 1):
+            w('    <block systemName="IB%d" length="%d.0" curve="0">\n      <systemName>IB%d</systemName>\n' % (i, i * 10, i))
+            if i % 2:
+                w('      <userName>Block %d</userName>\n' % i)
+            w('      <comment>Block %d</comment>\n      <speed>Normal</speed>\n      <permissive>no</permissive>\n' % i)
+            if numSensors:
+                w('      <occupancysensor>CS%d</occupancysensor>\n' % min(i, numSensors))
+            if i % 5 == 0 and counts['reporters']:
+                w('      <reporter systemName="LR1" useCurrent="no" />\n')
+            w('    </block>\n')
+        w('  </blocks>\n')
+        w('  <LayoutEditor class="jmri.jmrit.display.layoutEditor.configurexml.LayoutEditorXml" name="Main">\n')
+        for i in range(counts['panelItems']):
+            w('    <sensoricon sensor="CS%d" x="%d" y="%d" level="10" forcecontroloff="false" hidden="no" positionable="true" showtooltip="true" editable="true" momentary="false" icon="yes">\n' % (i % max(numSensors, 1) + 1, i % 1000, i // 1000))
+            w('      <active url="program:resources/icons/smallschematics/tracksegments/circuit-occupied.gif" degrees="0" scale="1.0">\n        <rotation>0</rotation>\n      </active>\n')
+            w('      <inactive url="program:resources/icons/smallschematics/tracksegments/circuit-empty.gif" degrees="0" scale="1.0">\n        <rotation>0</rotation>\n      </inactive>\n')
+            w('    </sensoricon>\n')
+        w('  </LayoutEditor>\n')
+        w('  <filehistory>\n    <operation>\n      <type>app</type>\n      <date>Sat Jan 01 12:00:00 EST 2022</date>\n    </operation>\n  </filehistory>\n')
+        w('  <!--Written by JMRI version 4.22 on Sat Jan 01 12:00:00 EST 2022-->\n')
+        w('</layout-config>\n')
+
+# Run a script in a new process. Returns the wall time, the peak memory in MB
+# and the output of the process.
+def runStage(command, workDir):
+    with tempfile.TemporaryFile() as outFile:
+        startTime = time.perf_counter()
+        process = subprocess.Popen([ sys.executable ] + command, cwd=workDir, stdout=outFile, stderr=subprocess.STDOUT)
+        pid, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - startTime
+        process.returncode = os.waitstatus_to_exitcode(status)
+        outFile.seek(0)
+        output = outFile.read().decode(errors='replace')
+    if process.returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(command), output))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peakMB = usage.ru_maxrss / (1e6 if sys.platform == 'darwin' else 1e3)
+    return seconds, peakMB, output
+
+# Returns the results of the stages, keeping the fastest of the repeated runs.
+# Each stage uses the output of the one before it.
+def runBenchmark(workDir, compileArgs, repeat, stageNames):
+    layoutFile = 'layout.xml'
+    csvDir = 'csv'
+    os.makedirs(os.path.join(workDir, csvDir), exist_ok=True)
+    stages = [
+        ('extract', [ os.path.join(scriptDir, 'extract.py'), '--csvDir', csvDir, layoutFile ]),
+        ('compile', [ os.path.join(scriptDir, 'compile.py'), '--csvDir', csvDir ] + compileArgs + [ layoutFile ]),
+        ('test', [ os.path.join(scriptDir, 'test.py'), layoutFile, 'layout_updated.xml' ]),
+        ]
+    results = {}
+    lastStage = max([ i for (i, (stage, command)) in enumerate(stages) if stage in stageNames ])
+    for (stage, command) in stages[:lastStage + 1]:
+        if stage not in stageNames:
+            runStage(command, workDir) # A later stage needs its output
+            continue
+        for _ in range(repeat):
+            seconds, peakMB, output = runStage(command, workDir)
+            if stage not in results or seconds < results[stage]['seconds']:
+                results[stage] = { 'seconds': seconds, 'peakMB': peakMB }
+        if stage == 'test' and 'Test passed' not in output:
+            raise RuntimeError('The round trip test failed:\n' + output[-2000:])
+    return results
+
+# Returns a list of the stages that are slower or use more memory than in the
+# baseline, by more than threshold, as a fraction
+def findRegressions(results, baseline, threshold):
+    regressions = []
+    for (stage, result) in results.items():
+        if stage not in baseline:
+            continue
+        for measure in [ 'seconds', 'peakMB' ]:
+            if result[measure] > baseline[stage][measure] * (1 + threshold):
+                regressions.append('%s %s: %.3f, baseline %.3f' % (stage, measure, result[measure], baseline[stage][measure]))
+    return regressions
+
+def main(args):
+    counts = { kind: int(round(args.scale * factor)) for (kind, factor) in scaleFactors.items() }
+    for kind in scaleFactors:
+        if getattr(args, kind) is not None:
+            counts[kind] = getattr(args, kind)
+    compileArgs = args.compileArgs.split()
+    # Results are only compared with a baseline of the same benchmark
+    benchmark = { 'counts': counts, 'compileArgs': compileArgs }
+    stageNames = args.stages.split(',')
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        workDir = args.workDir or tempDir
+        os.makedirs(workDir, exist_ok=True)
+        layoutFile = os.path.join(workDir, 'layout.xml')
+        generateLayout(layoutFile, counts)
+        print('Layout: %s, %.1f MB' % (', '.join('%d %s' % (counts[k], k) for k in counts), os.path.getsize(layoutFile) / 1e6))
+        results = runBenchmark(workDir, compileArgs, args.repeat, stageNames)
+
+    print('%-10s %10s %10s' % ('Stage', 'Time (s)', 'Peak (MB)'))
+    for (stage, result) in results.items():
+        print('%-10s %10.3f %10.1f' % (stage, result['seconds'], result['peakMB']))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as inputFile:
+            baselines = json.load(inputFile)
+    key = json.dumps(benchmark, sort_keys=True)
+    if args.saveBaseline:
+        baselines.setdefault(key, {}).update(results)
+        with open(args.baseline, 'w') as outFile:
+            json.dump(baselines, outFile, indent=2)
+        print('Saved the baseline in ' + args.baseline)
+        return 0
+    if key not in baselines:
+        print('No baseline for this benchmark in ' + args.baseline)
+        return 0
+    regressions = findRegressions(results, baselines[key], args.threshold)
+    for regression in regressions:
+        print('Regression in ' + regression)
+    if regressions:
+        return 1
+    print('No regressions beyond %d%% of the baseline' % round(args.threshold * 100))
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark extract, compile and test on a generated layout')
+    parser.add_argument('--scale', type=int, default=1000, help='Size of the layout. The number of objects of each kind is a multiple of this, which the other options override.')
+    for kind in scaleFactors:
+        parser.add_argument('--' + kind, type=int, default=None, help='Number of %s' % kind)
+    parser.add_argument('--compileArgs', type=str, default='', help='Extra arguments for compile.py, given as --compileArgs="--stream --jobs 4"')
+    parser.add_argument('--stages', type=str, default='extract,compile,test',
+        help='Stages to time, separated by commas. The stages that are left out are still run if a later stage needs them.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to run each stage. The fastest run is kept.')
+    parser.add_argument('--workDir', type=str, default=None, help='Directory in which to keep the generated files. By default a temporary directory is used.')
+    parser.add_argument('--baseline', type=str, default='bench_baseline.json', help='File in which the baselines are stored')
+    parser.add_argument('--saveBaseline', action='store_true', help='Save the results as the baseline instead of comparing with it')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Fraction by which a stage may be slower or use more memory than the baseline')
+    args = parser.parse_args()
+
+    sys.exit(main(args))
@@ -4,10 +4,32 @@
 # Software Foundation.
 
 import xml.etree.ElementTree as ET
-import csv
 import re
 import argparse
-from pathlib import Path
+import contextlib
+import ctypes
+import ctypes.util
+import database
+import hashlib
+import io
+import json
+import os
+import select
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import layoutscan
+import manifest
+import outputfiles
+import profiling
+import schema
+import validate
+import xmlbackend
 
 # This program loads externally managed objects in this order:
 # Sensors
@@ -18,53 +40,61 @@ from pathlib import Path
 # signalmasts
 # blocks
 
+profiler = profiling.Profiler()
+
+# Converters from CSV rows to XML elements, generated from the schemas
+sensorFromRow = schema.rowToElementFunction(schema.sensorSchema)
+turnoutFromRow = schema.rowToElementFunction(schema.turnoutSchema)
+lightFromRow = schema.rowToElementFunction(schema.lightSchema)
+reporterFromRow = schema.rowToElementFunction(schema.reporterSchema)
+tripleTurnoutSignalHeadFromRow = schema.rowToElementFunction(schema.tripleTurnoutSignalHeadSchema)
+singleTurnoutSignalHeadFromRow = schema.rowToElementFunction(schema.singleTurnoutSignalHeadSchema)
+signalMastFromRow = { kind: schema.rowToElementFunction(s) for (kind, s) in schema.signalMastSchemas.items() }
+blockFromRow = schema.rowToElementFunction(schema.blockSchema, offset=0) # Converts a BlockRow
+
 # There will generally be many files with sensor data
-def loadSensorFile(fileName, root, elementCounter):
-    with open(fileName, 'r') as inputFile:
-        sensorReader = csv.reader(inputFile)
+def loadSensorFile(fileName, tables=None):
+    with manifest.openRows(fileName, tables) as sensorReader:
         sensorsX = ET.Element('sensors')
-        root.insert(elementCounter, sensorsX)
+        yield sensorsX
         for row in sensorReader:
             if len(row) == 0:
                 continue
-            if row[0] == 'class':
+            if row[0] == 'sensor':
+                yield sensorFromRow(row)
+            elif row[0] == 'class':
                 className = row[1]
                 sensorsX.attrib['class'] = className
             elif row[0] == 'defaultInitialState':
                 defaultInitialState = row[1]
-                dis = ET.SubElement(sensorsX, 'defaultInitialState')
+                dis = ET.Element('defaultInitialState')
                 dis.text = defaultInitialState
+                yield dis
             elif row[0] == 'globalDebounceTimers':
-                globalDebounceTimersX = ET.SubElement(sensorsX, 'globalDebounceTimers')
+                globalDebounceTimersX = ET.Element('globalDebounceTimers')
                 goingActiveX = ET.SubElement(globalDebounceTimersX, 'goingActive')
                 goingActiveX.text = row[1]
                 goingInActiveX = ET.SubElement(globalDebounceTimersX, 'goingInActive')
                 goingInActiveX.text = row[2]
-            elif row[0] == 'sensor':
-                sensorX = ET.SubElement(sensorsX, 'sensor')
-                systemNameX = ET.SubElement(sensorX, 'systemName')
-                systemNameX.text = row[1]
-                if row[2].strip() != '':
-                    userNameX = ET.SubElement(sensorX, 'userName')
-                    userNameX.text = row[2]
-                sensorX.attrib['inverted'] = row[3]
-                if row[4].strip() != '':
-                    commentX = ET.SubElement(sensorX, 'comment')
-                    commentX.text = row[4]
-                if row[5].strip() != '':
-                    useGlobalDebounceTimerX = ET.SubElement(sensorX, 'useGlobalDebounceTimer')
-                    useGlobalDebounceTimerX.text = row[5]
-
-def loadTurnoutFile(fileName, root, elementCounter):
-    with open(fileName, 'r') as inputFile:
-        turnoutReader = csv.reader(inputFile)
+                yield globalDebounceTimersX
+
+def loadTurnoutFile(fileName, tables=None):
+    with manifest.openRows(fileName, tables) as turnoutReader:
         turnoutsX = ET.Element('turnouts')
-        root.insert(elementCounter, turnoutsX)
-        operationsX = ET.SubElement(turnoutsX, 'operations')
+        yield turnoutsX
+        # The operations element is always the first child. It is held back
+        # until the operation rows that precede the other rows have been read.
+        operationsX = ET.Element('operations')
+        operationsPending = True
         for row in turnoutReader:
             if len(row) == 0:
                 continue
-            if row[0] == 'class':
+            if row[0] == 'turnout':
+                if operationsPending:
+                    operationsPending = False
+                    yield operationsX
+                yield turnoutFromRow(row)
+            elif row[0] == 'class':
                 className = row[1]
                 turnoutsX.attrib['class'] = className
             elif row[0] == 'operations_automate':
@@ -80,394 +110,1190 @@ def loadTurnoutFile(fileName, root, elementCounter):
                 operationX.attrib['interval'] = interval
                 operationX.attrib['maxtries'] = maxtries
             elif row[0] == 'defaultclosedspeed':
-                defaultClosedSpeedX = ET.SubElement(turnoutsX, 'defaultclosedspeed')
+                if operationsPending:
+                    operationsPending = False
+                    yield operationsX
+                defaultClosedSpeedX = ET.Element('defaultclosedspeed')
                 defaultClosedSpeedX.text = row[1]
+                yield defaultClosedSpeedX
             elif row[0] == 'defaultthrownspeed':
-                defaultThrownSpeedX = ET.SubElement(turnoutsX, 'defaultthrownspeed')
+                if operationsPending:
+                    operationsPending = False
+                    yield operationsX
+                defaultThrownSpeedX = ET.Element('defaultthrownspeed')
                 defaultThrownSpeedX.text = row[1]
-            elif row[0] == 'turnout':
-                turnoutX = ET.SubElement(turnoutsX, 'turnout')
-                
-                systemName = row[1]
-                systemNameX = ET.SubElement(turnoutX, 'systemName')
-                systemNameX.text = systemName
-
-                userName = row[2]
-                if userName.strip() != '':
-                    userNameX = ET.SubElement(turnoutX, 'userName')
-                    userNameX.text = userName
-
-                comment = row[3]
-                if comment.strip() != '':
-                    commentX = ET.SubElement(turnoutX, 'comment')
-                    commentX.text = comment
-
-                feedback = row[4]
-                turnoutX.attrib['feedback'] = feedback
-
-                sensor1 = row[5]
-                if sensor1 != '':
-                    turnoutX.attrib['sensor1'] = sensor1
-
-                sensor2 = row[6]
-                if sensor2.strip() != '':
-                    turnoutX.attrib['sensor2'] = sensor2
-
-                inverted = row[7]
-                turnoutX.attrib['inverted'] = inverted
-
-                controlType = row[8]
-                if controlType.strip() != '':
-                    turnoutX.attrib['controlType'] = controlType
-
-                automate = row[9]
-                turnoutX.attrib['automate'] = automate
-
-                # Special addition for Loconet turnouts: disable sending OFF message
-                if systemName.startswith('L'):
-                    propertiesX = ET.SubElement(turnoutX, 'properties')
-                    propertyX = ET.SubElement(propertiesX, 'property')
-                    ET.SubElement(propertyX, 'key').text = 'Send ON/OFF'
-                    valueX = ET.SubElement(propertyX, 'value')
-                    valueX.attrib['class'] = 'java.lang.Boolean'
-                    valueX.text = 'false'
-
-                divergingSpeed = row[10]
-                if divergingSpeed.strip() != '':
-                    ET.SubElement(turnoutX, 'divergingSpeed').text = divergingSpeed
-
-                straightSpeed = row[11]
-                if straightSpeed.strip() != '':
-                    ET.SubElement(turnoutX, 'straightSpeed').text = straightSpeed
-
-                #propertiesS = row[10]
-                #propertiesL = eval(propertiesS)
-                #if len(propertiesL) > 0:
-                #    propertiesX = ET.SubElement(turnoutX, 'properties')
-                #    for kvp in propertiesL:
-                #        propertyX = ET.SubElement(propertiesX, 'property')
-                #        keyX = ET.SubElement(propertyX, 'key')
-                #        keyX.text = kvp[0]
-                #        valueX = ET.SubElement(propertyX, 'value')
-                #        valueX.text = kvp[1]
-
-def loadLightFile(fileName, root, elementCounter):
-    with open(fileName, 'r') as inputFile:
-        lightReader = csv.reader(inputFile)
+                yield defaultThrownSpeedX
+        if operationsPending:
+            yield operationsX
+
+def loadLightFile(fileName, tables=None):
+    with manifest.openRows(fileName, tables) as lightReader:
         lightsX = ET.Element('lights')
-        root.insert(elementCounter, lightsX)
+        yield lightsX
         for row in lightReader:
             if len(row) == 0:
                 continue
-            if row[0] == 'class':
+            if row[0] == 'light':
+                yield lightFromRow(row)
+            elif row[0] == 'class':
                 lightsX.attrib['class'] = row[1]
-            elif row[0] == 'light':
-                systemName = row[1]
-                userName = row[2]
-                comment = row[3]
-                minIntensity = row[4]
-                maxIntensity = row[5]
-                transitionTime = row[6]
-                controlType = row[7]
-                controlSensor = row[8]
-                sensorSense = row[9]
-                lightX = ET.SubElement(lightsX, 'light')
-                ET.SubElement(lightX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(lightX, 'userName').text = userName
-                if comment != '':
-                    ET.SubElement(lightX, 'comment').text = comment
-                lightX.attrib['minIntensity'] = minIntensity
-                lightX.attrib['maxIntensity'] = maxIntensity
-                lightX.attrib['transitionTime'] = transitionTime
-                
-                if controlType != '' and controlSensor != '' and sensorSense != '':
-                    lightcontrolX = ET.SubElement(lightX, 'lightcontrol')
-                    lightcontrolX.attrib['controlType'] = controlType
-                    lightcontrolX.attrib['controlSensor'] = controlSensor
-                    lightcontrolX.attrib['sensorSense'] = sensorSense
-
-def loadReporterFile(fileName, root, elementCounter):
-    with open(fileName, 'r') as inputFile:
-        reporterReader = csv.reader(inputFile)
+
+def loadReporterFile(fileName, tables=None):
+    with manifest.openRows(fileName, tables) as reporterReader:
         reportersX = ET.Element('reporters')
-        root.insert(elementCounter, reportersX)
+        yield reportersX
         for row in reporterReader:
             if len(row) == 0:
                 continue
+            elif row[0] == 'reporter':
+                yield reporterFromRow(row)
             elif row[0] == 'class':
                 reportersX.attrib['class'] = row[1]
-            elif row[0] == 'reporter':
-                systemName = row[1]
-                userName = row[2]
-                comment = row[3]
-                reporterX = ET.SubElement(reportersX, 'reporter')
-                ET.SubElement(reporterX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(reporterX, 'userName').text = userName
-                if comment != '':
-                    ET.SubElement(reporterX, 'comment').text = comment
-
-def loadSignalHeads(inputDir, root, elementCounter):
+
+def loadSignalHeads(tripleTurnoutFileName, singleTurnoutFileName, tables=None):
     signalHeadsX = ET.Element('signalheads')
-    root.insert(elementCounter, signalHeadsX)
-    with open(inputDir + 'signalheads_tripleturnout.csv', 'r') as inputFile:
-        signalHeadsReader = csv.reader(inputFile)
-        for row in signalHeadsReader:
-            if len(row) == 0:
-                continue
-            if row[0] == 'class':
-                signalHeadsX.attrib['class'] = row[1]
-            elif row[0] == 'signalhead':
-                systemName = row[1]
-                userName = row[2]
-                comment = row[3]
-                green = row[4]
-                yellow = row[5]
-                red = row[6]
-                signalHeadX = ET.SubElement(signalHeadsX, 'signalhead')
-                signalHeadX.attrib['class'] = 'jmri.implementation.configurexml.TripleTurnoutSignalHeadXml'
-                ET.SubElement(signalHeadX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(signalHeadX, 'userName').text = userName
-                if comment != '':
-                    ET.SubElement(signalHeadX, 'comment').text = comment
-                if green != '':
-                    turnoutnameX = ET.SubElement(signalHeadX, 'turnoutname')
-                    turnoutnameX.text = green
-                    turnoutnameX.attrib['defines'] = 'green'
-                if yellow != '':
-                    turnoutnameX = ET.SubElement(signalHeadX, 'turnoutname')
-                    turnoutnameX.text = yellow
-                    turnoutnameX.attrib['defines'] = 'yellow'
-                if red != '':
-                    turnoutnameX = ET.SubElement(signalHeadX, 'turnoutname')
-                    turnoutnameX.text = red
-                    turnoutnameX.attrib['defines'] = 'red'
-    with open(inputDir + 'signalheads_singleturnout.csv', 'r') as inputFile:
-        signalHeadsReader = csv.reader(inputFile)
-        for row in signalHeadsReader:
-            if len(row) == 0:
-                continue
-            if row[0] == 'class':
-                signalHeadsX.attrib['class'] = row[1]
-            elif row[0] == 'signalhead':
-                systemName = row[1]
-                userName = row[2]
-                comment = row[3]
-                thrown = row[4]
-                closed = row[5]
-                aspect = row[6]
-                signalHeadX = ET.SubElement(signalHeadsX, 'signalhead')
-                signalHeadX.attrib['class'] = 'jmri.implementation.configurexml.SingleTurnoutSignalHeadXml'
-                ET.SubElement(signalHeadX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(signalHeadX, 'userName').text = userName
-                if comment != '':
-                    ET.SubElement(signalHeadX, 'comment').text = comment
-                if thrown != '':
-                    appearanceX = ET.SubElement(signalHeadX, 'appearance')
-                    appearanceX.text = thrown
-                    appearanceX.attrib['defines'] = 'thrown'
-                if closed != '':
-                    appearanceX = ET.SubElement(signalHeadX, 'appearance')
-                    appearanceX.text = closed
-                    appearanceX.attrib['defines'] = 'closed'
-                if aspect != '':
-                    turnoutnameX = ET.SubElement(signalHeadX, 'turnoutname')
-                    turnoutnameX.text = aspect
-                    turnoutnameX.attrib['defines'] = 'aspect'
-
-
-def loadSignalMasts(fileName, root, elementCounter):
-    with open(fileName, 'r') as inputFile:
-        signalMastsReader = csv.reader(inputFile)
+    yield signalHeadsX
+    for (fileName, signalHeadFromRow) in [ (tripleTurnoutFileName, tripleTurnoutSignalHeadFromRow),
+            (singleTurnoutFileName, singleTurnoutSignalHeadFromRow) ]:
+        with manifest.openRows(fileName, tables) as signalHeadsReader:
+            for row in signalHeadsReader:
+                if len(row) == 0:
+                    continue
+                if row[0] == 'signalhead':
+                    yield signalHeadFromRow(row)
+                elif row[0] == 'class':
+                    signalHeadsX.attrib['class'] = row[1]
+
+def loadSignalMasts(fileName, tables=None):
+    with manifest.openRows(fileName, tables) as signalMastsReader:
         signalMastsX = ET.Element('signalmasts')
-        root.insert(elementCounter, signalMastsX)
+        yield signalMastsX
         for row in signalMastsReader:
             if len(row) == 0:
                 continue
-            if row[0] == 'class':
+            mastFromRow = signalMastFromRow.get(row[0])
+            if mastFromRow is not None:
+                yield mastFromRow(row)
+            elif row[0] == 'class':
                 signalMastsX.attrib['class'] = row[1]
-            elif row[0] == 'signalmast' or row[0] == 'virtualsignalmast' or row[0] == 'mqttsignalmast':
-                systemName = row[1]
-                userName = row[2].strip()
-                comment = row[3].strip()
-                unlit = row[4]
-                da = row[5].strip()
-                if da == '':
-                    disabledAspects = []
-                else:
-                    disabledAspects = eval(row[5])
-                if row[0] == 'signalmast':
-                    signalMastX = ET.SubElement(signalMastsX, 'signalmast')
-                    signalMastX.attrib['class'] = 'jmri.implementation.configurexml.SignalHeadSignalMastXml'
-                elif row[0] == 'virtualsignalmast':
-                    signalMastX = ET.SubElement(signalMastsX, 'virtualsignalmast')
-                    signalMastX.attrib['class'] = 'jmri.implementation.configurexml.VirtualSignalMastXml'
-                elif row[0] == 'mqttsignalmast':
-                    signalMastX = ET.SubElement(signalMastsX, 'mqttsignalmast')
-                    signalMastX.attrib['class'] = 'jmri.jmrix.mqtt.configurexml.MqttSignalMastXml'
-                ET.SubElement(signalMastX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(signalMastX, 'userName').text = userName
-                if comment != '':
-                    ET.SubElement(signalMastX, 'comment').text = comment
-                ET.SubElement(signalMastX, 'unlit').attrib['allowed'] = unlit
-                if len(disabledAspects) > 0:
-                    disabledAspectsX = ET.SubElement(signalMastX, 'disabledAspects')
-                    for d in disabledAspects:
-                        ET.SubElement(disabledAspectsX, 'disabledAspect').text = d
-
-def loadBlocks(fileName, root, elementCounter):
-    blocksX = ET.Element('blocks')
-    root.insert(elementCounter, blocksX)
-    # Create forward reference blocks
-    with open(fileName, 'r') as inputFile:
-        blocksReader = csv.reader(inputFile)
+
+# A block row of blocks.csv. lineNumber is the line of the row in the file,
+# for the problems found by validation.
+BlockRow = namedtuple('BlockRow', schema.blockSchema.columnNames() + [ 'lineNumber' ])
+
+# The table last read from each blocks.csv on disk, with the signature of the
+# file, so that validation and loadBlocks read the file once
+blocksTables = {}
+
+# Parse blocks.csv in a single pass. Returns the block manager class, the
+# default speeds and the block rows in file order.
+def readBlocks(fileName, tables=None):
+    if tables is None:
+        signature = sourceSignature([ fileName ])
+        if fileName in blocksTables and blocksTables[fileName][0] == signature:
+            return blocksTables[fileName][1]
+    numColumns = len(schema.blockSchema.columns)
+    className = None
+    defaultSpeeds = []
+    blockRows = []
+    with manifest.openRows(fileName, tables) as blocksReader:
         for row in blocksReader:
             if len(row) == 0:
                 continue
-            if row[0] == 'class':
-                blocksX.attrib['class'] = row[1]
+            if row[0] == 'block':
+                blockRows.append(BlockRow(*row[1:numColumns + 1], blocksReader.line_num))
+            elif row[0] == 'class':
+                className = row[1]
             elif row[0] == 'defaultspeed':
-                ET.SubElement(blocksX, 'defaultspeed').text = row[1]
-            elif row[0] == 'block':
-                systemName = row[1]
-                userName = row[2]
-                blockX = ET.SubElement(blocksX, 'block')
-                blockX.attrib['systemName'] = systemName
-                ET.SubElement(blockX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(blockX, 'userName').text = systemName
+                defaultSpeeds.append(row[1])
+    if tables is None:
+        blocksTables[fileName] = (signature, (className, defaultSpeeds, blockRows))
+    return className, defaultSpeeds, blockRows
+
+def loadBlocks(fileName, tables=None):
+    blocksX = ET.Element('blocks')
+    yield blocksX
+    className, defaultSpeeds, blockRows = readBlocks(fileName, tables)
+    if className is not None:
+        blocksX.attrib['class'] = className
+    for defaultSpeed in defaultSpeeds:
+        defaultSpeedX = ET.Element('defaultspeed')
+        defaultSpeedX.text = defaultSpeed
+        yield defaultSpeedX
+    # Create forward reference blocks
+    for block in blockRows:
+        blockX = ET.Element('block')
+        blockX.attrib['systemName'] = block.systemName
+        ET.SubElement(blockX, 'systemName').text = block.systemName
+        if block.userName != '':
+            ET.SubElement(blockX, 'userName').text = block.systemName
+        yield blockX
     # Now create the full blocks
-    with open(fileName, 'r') as inputFile:
-        blocksReader = csv.reader(inputFile)
-        for row in blocksReader:
-            if len(row) == 0:
-                continue
-            if row[0] == 'block':
-                systemName = row[1]
-                userName = row[2]
-                length = row[3]
-                curve = row[4]
-                comment = row[5]
-                permissive = row[6]
-                occupancySensor = row[7]
-                speed = row[8]
-                reporterSystemName = row[9]
-                reporterUseCurrent = row[10]
-                blockX = ET.SubElement(blocksX, 'block')
-                blockX.attrib['systemName'] = systemName
-                ET.SubElement(blockX, 'systemName').text = systemName
-                if userName != '':
-                    ET.SubElement(blockX, 'userName').text = userName
-                if length != '':
-                    blockX.attrib['length'] = length
-                if curve != '':
-                    blockX.attrib['curve'] = curve
-                if comment != '':
-                    ET.SubElement(blockX, 'comment').text = comment
-                if speed != '':
-                    ET.SubElement(blockX, 'speed').text = speed
-                if permissive != '':
-                    ET.SubElement(blockX, 'permissive').text = permissive
-                if occupancySensor != '':
-                    ET.SubElement(blockX, 'occupancysensor').text = occupancySensor
-                if reporterSystemName != '':
-                    reporterX = ET.SubElement(blockX, 'reporter')
-                    reporterX.attrib['systemName'] = reporterSystemName
-                    reporterX.attrib['useCurrent'] = reporterUseCurrent
-
-def removeElements(root, tagName):
-    elements = root.findall(tagName)
-    for e in elements:
-        root.remove(e)
+    for block in blockRows:
+        yield blockFromRow(block)
 
-def main(args):
-    # Load the reduced XML file
-    inputDir = args.csvDir
-    if not inputDir.endswith('/'):
-        inputDir = inputDir + '/'
-    tree = ET.parse(args.layoutFile)
-    root = tree.getroot()
-
-    # Remove all of the objects that are externally managed
-    removeElements(root, 'sensors')
-    removeElements(root, 'turnouts')
-    removeElements(root, 'lights')
-    removeElements(root, 'reporters')
-    removeElements(root, 'signalheads')
-    removeElements(root, 'signalmasts')
-    removeElements(root, 'blocks')
-
-    elementCounter = 1 # The index of the the insertion point for the next element
-    
-    # Get a list of the CSV files for sensors, turnouts and lights
-    p = Path(inputDir)
-    csvf = list(p.glob('*.csv'))
-    fileNames = [ str(x) for x in csvf ]
-    sensorFileNames = [ x for x in fileNames if x.find('sensor_') > 0 ]
-    turnoutFileNames = [ x for x in fileNames if x.find('turnout_') > 0 ]
-    lightsFileNames = [ x for x in fileNames if x.find('light_') > 0 ]
-    reportersFileNames = [ x for x in fileNames if x.find('reporter_') > 0 ]
-
-    for sensorFileName in sensorFileNames:
+# The tag of the section made by each loader
+loaderTags = {
+    loadSensorFile: 'sensors',
+    loadTurnoutFile: 'turnouts',
+    loadLightFile: 'lights',
+    loadReporterFile: 'reporters',
+    loadSignalHeads: 'signalheads',
+    loadSignalMasts: 'signalmasts',
+    loadBlocks: 'blocks',
+    }
+
+# The object type and the schemas by row kind of the source files of each
+# loader, in the order of the source files of the section
+loaderSources = {
+    loadSensorFile: [ ('sensor', { 'sensor': schema.sensorSchema }) ],
+    loadTurnoutFile: [ ('turnout', { 'turnout': schema.turnoutSchema }) ],
+    loadLightFile: [ ('light', { 'light': schema.lightSchema }) ],
+    loadReporterFile: [ ('reporter', { 'reporter': schema.reporterSchema }) ],
+    loadSignalHeads: [ ('signalhead', { 'signalhead': schema.tripleTurnoutSignalHeadSchema }),
+        ('signalhead', { 'signalhead': schema.singleTurnoutSignalHeadSchema }) ],
+    loadSignalMasts: [ ('signalmast', schema.signalMastSchemas) ],
+    loadBlocks: [ ('block', { 'block': schema.blockSchema }) ],
+    }
+
+# The source files of the sections, as validate.validate takes them
+def sectionSources(sections):
+    sources = []
+    for (loaderFunction, loaderArgs, skipMessage, sourceFiles) in sections:
+        for (sourceFile, (objectType, schemas)) in zip(sourceFiles, loaderSources[loaderFunction]):
+            sources.append((objectType, sourceFile, schemas))
+    return sources
+
+# Scan a source file for validation. blocks.csv is scanned from readBlocks,
+# which keeps the table for loadBlocks. A file that readBlocks cannot parse is
+# scanned row by row, which reports the rows that are wrong.
+def scanSourceFile(objectType, fileName, schemas):
+    if objectType == 'block':
         try:
-            loadSensorFile(sensorFileName, root, elementCounter)
-            elementCounter += 1
-        except:
-            print('Skipping loading sensor file ' + sensorFileName)
+            className, defaultSpeeds, blockRows = readBlocks(fileName)
+            reader = database.RowReader(iter([ (block.lineNumber, 'block') + block[:-1] for block in blockRows ]), [])
+            return validate.scanRows(reader, schemas)
+        except Exception:
+            pass
+    return validate.scanFile(fileName, schemas)
+
+# Returns the problems found in the source files of the sections, from their
+# scans in sectionScans
+def sectionProblems(sections, sectionScans):
+    scans = []
+    for section in sections:
+        scans.extend(sectionScans.scans(section))
+    return validate.resolve(sectionSources(sections), scans)
+
+# Check the names and references in the source files of the sections. Prints
+# the problems found and returns whether there were none. The files on disk
+# are scanned with sectionScans, if it is given, so that only the files that
+# have changed since it last scanned them are read again.
+def validateSections(sections, tables=None, sectionScans=None):
+    if tables is not None:
+        problems = validate.validate(sectionSources(sections), tables)
+    else:
+        problems = sectionProblems(sections, sectionScans or SectionScans())
+    for problem in problems:
+        print(problem)
+    if problems:
+        print('%d problems found in the CSV files' % len(problems))
+    return len(problems) == 0
 
-    for turnoutFileName in turnoutFileNames:
+# Each loader above is a generator. It first yields the empty section element
+# (once its input file is open) and then yields the children of the section
+# one at a time. The section attributes are known before the first child.
+# A section is described by the loader function and the arguments to call it
+# with, so that it can also be loaded in a worker process.
+
+# Build the whole section in memory. The section is added to placed as soon
+# as it is created, so that a section that fails part way is kept, as it is
+# when streamed.
+def buildSection(loaderFunction, loaderArgs, placed):
+    loader = loaderFunction(*loaderArgs)
+    sectionX = next(loader)
+    placed.append((sectionX.tag, sectionX))
+    for childX in loader:
+        sectionX.append(childX)
+    return len(sectionX)
+
+# In streaming mode, sections are represented in the tree by placeholders
+# which are replaced by the streamed section text when the file is written.
+placeholderTag = 'compileSection'
+placeholderPattern = re.compile(r'(?:\n  )?<' + placeholderTag + r' index="(\d+)" />')
+
+def placePlaceholder(section, sections, placed):
+    placeholderX = xmlbackend.Element(placeholderTag)
+    placeholderX.attrib['index'] = str(len(sections))
+    placed.append((loaderTags[section[0]], placeholderX))
+    sections.append(section)
+
+# Adds the section, or its placeholder, to placed as a (tag, element) pair
+def addSection(loaderFunction, loaderArgs, skipMessage, sourceFiles, sections, placed):
+    if sections is not None:
+        section = (loaderFunction, loaderArgs, skipMessage, sourceFiles)
+        placePlaceholder(section, sections, placed)
+        return
+    try:
+        with profiler.phase(loaderFunction.__name__, ' '.join(sourceFiles)) as p:
+            p.count = buildSection(loaderFunction, loaderArgs, placed)
+    except:
+        print(*skipMessage)
+
+# Write a section as a child of the root, one child element at a time. The text
+# is the same as what ET.indent followed by tree.write produces for the section.
+def writeSection(outFile, loader):
+    sectionX = next(loader)
+    outFile.write('\n  ')
+    started = False
+    count = 0
+    try:
+        for childX in loader:
+            count += 1
+            if not started:
+                tags = ET.tostring(sectionX, encoding='unicode', short_empty_elements=False)
+                outFile.write(tags[:-len('</' + sectionX.tag + '>')])
+                started = True
+            ET.indent(childX, level=2)
+            outFile.write('\n    ')
+            outFile.write(ET.tostring(childX, encoding='unicode'))
+    finally:
+        if started:
+            outFile.write('\n  </' + sectionX.tag + '>')
+        else:
+            outFile.write(ET.tostring(sectionX, encoding='unicode'))
+    return count
+
+# Serialized sections can be cached on disk so that unchanged CSV files need not
+# be parsed again. A cached fragment is keyed by the loader, the loader version
+# and the contents of the CSV files it was made from.
+# Increment loaderVersion whenever a loader changes the XML that it produces.
+loaderVersion = 4
+
+# Returns None if a source file cannot be read, in which case the section is
+# loaded without the cache and fails in the usual way.
+def sectionKey(loaderName, sourceFiles):
+    h = hashlib.sha256()
+    h.update(('%s:%d' % (loaderName, loaderVersion)).encode())
+    for sourceFile in sourceFiles:
         try:
-            loadTurnoutFile(turnoutFileName, root, elementCounter)
-            elementCounter += 1
-        except:
-            print('Skipping loading turnout file ' + turnoutFileName)
+            with open(sourceFile, 'rb') as inputFile:
+                h.update(hashlib.sha256(inputFile.read()).digest())
+        except OSError:
+            return None
+    return h.hexdigest()
+
+# Returns None if the fragment is not in the cache
+def readFragment(fragmentFileName):
+    try:
+        with open(fragmentFileName, 'r', encoding='UTF-8', newline='') as fragmentFile:
+            return fragmentFile.read()
+    except OSError:
+        return None
+
+# Cache files are written under a temporary name and then renamed, so that a
+# cache file is either complete or missing
+def cacheTempFileName(fileName):
+    return '%s.%d.%d.tmp' % (fileName, os.getpid(), threading.get_ident())
 
-    for lightFileName in lightsFileNames:
+# Returns whether the fragment was written. The cache only saves time, so a
+# fragment that cannot be written is left out of it.
+def writeFragment(fragmentFileName, text):
+    tempFileName = cacheTempFileName(fragmentFileName)
+    try:
+        with open(tempFileName, 'w', encoding='UTF-8', errors='xmlcharrefreplace', newline='') as fragmentFile:
+            fragmentFile.write(text)
+        os.replace(tempFileName, fragmentFileName)
+        return True
+    except OSError:
+        if os.path.exists(tempFileName):
+            os.remove(tempFileName)
+        return False
+
+# Writes a section to outFile and to its fragment in the cache at the same time,
+# so that the section is not held in memory. An error writing the fragment only
+# leaves the section out of the cache.
+class FragmentWriter:
+    def __init__(self, outFile, fragmentFileName):
+        self.outFile = outFile
+        self.fragmentFileName = fragmentFileName
+        self.tempFileName = cacheTempFileName(fragmentFileName)
         try:
-            loadLightFile(lightFileName, root, elementCounter)
-            elementCounter += 1
-        except:
-            print('Skipping loading lights file ', lightFileName)
+            self.fragmentFile = open(self.tempFileName, 'w', encoding='UTF-8', errors='xmlcharrefreplace', newline='')
+        except OSError:
+            self.fragmentFile = None
 
-    for reporterFileName in reportersFileNames:
+    def write(self, text):
+        self.outFile.write(text)
+        if self.fragmentFile is not None:
+            try:
+                self.fragmentFile.write(text)
+            except OSError:
+                self.discard()
+
+    # Returns whether the fragment was written
+    def commit(self):
+        if self.fragmentFile is None:
+            return False
         try:
-            loadReporterFile(reporterFileName, root, elementCounter)
-            elementCounter += 1
-        except:
-            print('Skipping loading reporter file ' + reporterFileName)
+            self.fragmentFile.close()
+            os.replace(self.tempFileName, self.fragmentFileName)
+            return True
+        except OSError:
+            self.discard()
+            return False
 
-    elementCounter += 1 # Skip past the memories tag
+    def discard(self):
+        if self.fragmentFile is not None:
+            try:
+                self.fragmentFile.close()
+            except OSError:
+                pass
+            self.fragmentFile = None
+        if os.path.exists(self.tempFileName):
+            os.remove(self.tempFileName)
 
+# Returns the cache key of the section, or None if it was not cached, and the
+# number of child elements loaded, or None if the section came from the cache.
+# A section that fails to load is written as far as it was loaded, and not cached.
+def writeCachedSection(outFile, loader, sourceFiles, cacheDir):
+    key = None
+    if cacheDir:
+        key = sectionKey(loader.__name__, sourceFiles)
+    if key is None:
+        return None, writeSection(outFile, loader)
+    fragmentFileName = os.path.join(cacheDir, key + '.xml')
+    text = readFragment(fragmentFileName)
+    if text is not None:
+        loader.close()
+        outFile.write(text)
+        return key, None
+    fragmentWriter = FragmentWriter(outFile, fragmentFileName)
     try:
-        loadSignalHeads(inputDir, root, elementCounter)
-        elementCounter += 1
+        count = writeSection(fragmentWriter, loader)
     except:
-        print('Skipping loading of signal heads')
+        fragmentWriter.discard()
+        raise
+    if not fragmentWriter.commit():
+        return None, count
+    return key, count
 
+# The names of the files kept in the cache for each section: the key from
+# sectionKey, then .xml for the fragment or .names.json for the scans of its
+# source files from SectionScans, and the suffix that writeFragment adds to a
+# file that is still being written. Other files in the cache directory are
+# never removed.
+cacheFilePattern = re.compile(r'([0-9a-f]{64})(?:\.xml|\.names\.json)(?:\.(\d+)\.\d+\.tmp)?')
+
+# Remove the cached files of CSV files that have since changed or disappeared,
+# and the temporary files left by other processes. The temporary files of this
+# process may still be being written.
+def pruneCache(cacheDir, usedKeys):
+    for name in os.listdir(cacheDir):
+        match = cacheFilePattern.fullmatch(name)
+        if match is None:
+            continue
+        key, pid = match.groups()
+        if (pid is None and key not in usedKeys) or (pid is not None and int(pid) != os.getpid()):
+            try:
+                os.remove(os.path.join(cacheDir, name))
+            except OSError:
+                pass
+
+# The validation scans of the source files of each section, as validate.scanRows
+# makes them. The scans are kept in memory with the modification time and size
+# of the files, and in the cache directory, if there is one, under the cache
+# key of the section. A section whose files have not changed is not read again.
+class SectionScans:
+    def __init__(self, cacheDir=None):
+        if cacheDir:
+            os.makedirs(cacheDir, exist_ok=True)
+        self.cacheDir = cacheDir
+        self.sectionScans = {} # Source files to their signature and scans
+
+    # Returns the scan of each source file of the section
+    def scans(self, section):
+        loaderFunction, loaderArgs, skipMessage, sourceFiles = section
+        signature = sourceSignature(sourceFiles)
+        key = tuple(sourceFiles)
+        if key in self.sectionScans and self.sectionScans[key][0] == signature:
+            return self.sectionScans[key][1]
+        scansFileName = None
+        scans = None
+        if self.cacheDir:
+            cacheKey = sectionKey(loaderFunction.__name__, sourceFiles)
+            if cacheKey is not None:
+                scansFileName = os.path.join(self.cacheDir, cacheKey + '.names.json')
+                text = readFragment(scansFileName)
+                if text is not None:
+                    scans = json.loads(text)
+        if scans is None:
+            scans = [ scanSourceFile(objectType, sourceFile, schemas) for (sourceFile, (objectType, schemas)) in
+                zip(sourceFiles, loaderSources[loaderFunction]) ]
+            if scansFileName is not None:
+                writeFragment(scansFileName, json.dumps(scans))
+        self.sectionScans[key] = (signature, scans)
+        return scans
+
+# Load a section into a string. This runs in a worker process when --jobs is
+# given, and returns the text along with whether the section loaded completely,
+# and the cache key and element count from writeCachedSection.
+def renderSection(section, cacheDir):
+    loaderFunction, loaderArgs, skipMessage, sourceFiles = section
+    buffer = io.StringIO()
     try:
-        loadSignalMasts(inputDir + 'signalmasts.csv', root, elementCounter)
-        elementCounter += 1
+        key, count = writeCachedSection(buffer, loaderFunction(*loaderArgs), sourceFiles, cacheDir)
+        return buffer.getvalue(), True, key, count
     except:
-        print('Skipping loading signal masts')
+        return buffer.getvalue(), False, None, None
+
+# Returns the text of the layout split at the placeholders. The text between
+# the placeholders is at the even indexes, the section indexes are at the odd ones.
+def splitLayout(tree):
+    xmlbackend.indent(tree)
+    skeleton = xmlbackend.tostring(tree.getroot())
+    return placeholderPattern.split(skeleton)
 
+xmlDeclaration = "<?xml version='1.0' encoding='UTF-8'?>\n"
+
+# Write the sections between pieces of the layout. pieces alternates between
+# the layout pieces, which are written by writePiece, and section indexes.
+def writeSections(outFile, pieces, sections, writePiece, cacheDir=None, jobs=1):
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+    usedKeys = set()
+    executor = None
+    if jobs > 1:
+        # The placeholders appear in the file in the order they were inserted,
+        # so the rendered sections are consumed in the order they were submitted.
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        rendered = executor.map(renderSection, sections, [cacheDir] * len(sections))
     try:
-        loadBlocks(inputDir + 'blocks.csv', root, elementCounter)
-    except:
-        print('Skipping loading blocks')
+        writePiece(pieces[0])
+        for i in range(1, len(pieces), 2):
+            loaderFunction, loaderArgs, skipMessage, sourceFiles = sections[int(pieces[i])]
+            with profiler.phase(loaderFunction.__name__, ' '.join(sourceFiles)) as p:
+                if executor:
+                    text, loaded, key, p.count = next(rendered)
+                    outFile.write(text)
+                else:
+                    try:
+                        key, p.count = writeCachedSection(outFile, loaderFunction(*loaderArgs), sourceFiles, cacheDir)
+                        loaded = True
+                    except:
+                        loaded = False
+            if loaded:
+                usedKeys.add(key)
+            else:
+                print(*skipMessage)
+            writePiece(pieces[i + 1])
+    finally:
+        if executor:
+            executor.shutdown()
+    if cacheDir:
+        pruneCache(cacheDir, usedKeys)
+
+# Write the sections that have already been rendered, as the text of each section
+def writeRenderedSections(outFile, pieces, texts, writePiece):
+    writePiece(pieces[0])
+    for i in range(1, len(pieces), 2):
+        outFile.write(texts[int(pieces[i])])
+        writePiece(pieces[i + 1])
+
+# If texts is given, it is the rendered text of each section
+def writeStreamed(tree, sections, newFileName, cacheDir=None, jobs=1, texts=None):
+    pieces = splitLayout(tree)
+    with outputfiles.OutputFile(newFileName, 'w', encoding='UTF-8', errors='xmlcharrefreplace') as outFile:
+        outFile.write(xmlDeclaration)
+        with profiler.phase('write', newFileName):
+            if texts is None:
+                writeSections(outFile, pieces, sections, outFile.write, cacheDir, jobs)
+            else:
+                writeRenderedSections(outFile, pieces, texts, outFile.write)
+
+# Splice mode. The layout file is not parsed. Instead the top level elements of
+# the layout are located with a scanner over the bytes of the file, and the ones
+# that are not externally managed are copied to the output unchanged, along with
+# the text before each of them. Only the managed sections are written anew. The
+# time taken depends on the size of the managed sections rather than on the
+# size of the panels and the rest of the layout.
+
+def writeSpliced(layoutFile, inputDir, newFileName, cacheDir=None, jobs=1, texts=None, tables=None):
+    with layoutscan.layoutBytes(layoutFile) as data:
+        encoding = layoutscan.encodingOf(data)
+        if not layoutscan.scannable(encoding):
+            raise ValueError('Cannot splice a layout file encoded in ' + encoding)
+        firstLine = data.find(b'\n')
+        newline = '\r\n' if firstLine > 0 and data[firstLine - 1] == ord('\r') else '\n'
+        with profiler.phase('scan', layoutFile) as p:
+            rootTag, contentStart, elements = layoutscan.scanLayout(data)
+            p.count = len(elements)
+
+        # The sections are placed among the other elements of the layout in the
+        # same way as in the tree. The elements that are kept are represented by
+        # their byte ranges, including the text before them. The elements that
+        # place the sections keep their tags.
+        root = xmlbackend.Element('layout-config')
+        ranges = []
+        previousEnd = contentStart
+        for (tag, start, end) in elements:
+            if tag in managedTags:
+                root.append(xmlbackend.Element(tag))
+            else:
+                rangeTag = tag if tag in canonicalOrder else 'range'
+                root.append(xmlbackend.Element(rangeTag, { 'index': str(len(ranges)) }))
+                ranges.append((previousEnd, end))
+            previousEnd = end
+        sections = []
+        sourceFiles = manifest.sourceFiles(inputDir) if tables is None else manifest.tableSourceFiles(tables)
+        addSections(root, inputDir, sourceFiles, sections, tables)
+
+        pieces = []
+        piece = [ (0, contentStart) ]
+        for child in root:
+            if child.tag == placeholderTag:
+                pieces += [ piece, child.attrib['index'] ]
+                piece = []
+            else:
+                piece.append(ranges[int(child.attrib['index'])])
+        piece.append((previousEnd, len(data)))
+        pieces.append(piece)
 
-    ET.indent(tree)
-    comps = args.layoutFile.split('.')
-    newFileName = comps[0] + '_updated.' + comps[1]
-    tree.write(newFileName, xml_declaration=True, encoding='UTF-8')
+        view = memoryview(data)
+        try:
+            with outputfiles.OutputFile(newFileName, 'wb') as outBinary:
+                outFile = io.TextIOWrapper(outBinary, encoding=encoding, errors='xmlcharrefreplace',
+                    newline=newline, write_through=True)
+                def writeRanges(piece):
+                    for (start, end) in piece:
+                        outBinary.write(view[start:end])
+                with profiler.phase('write', newFileName):
+                    if texts is None:
+                        writeSections(outFile, pieces, sections, writeRanges, cacheDir, jobs)
+                    else:
+                        writeRenderedSections(outFile, pieces, texts, writeRanges)
+                outFile.detach()
+        finally:
+            view.release()
+
+# Watch mode. The layout file is loaded once and the sections are kept in
+# memory. When CSV files change, only the sections made from them are loaded
+# again. Changes are detected with inotify where it is available, otherwise
+# by polling the modification times of the CSV files.
+
+# IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+inotifyMask = 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+inotifyEventHeader = struct.Struct('iIII')
+
+# Returns a non-blocking inotify file descriptor watching directory, or None
+def openInotify(directory):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), inotifyMask) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+# Returns the names of the files in the pending inotify events
+def readInotifyEvents(fd):
+    names = []
+    while True:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return names
+        position = 0
+        while position < len(data):
+            wd, mask, cookie, length = inotifyEventHeader.unpack_from(data, position)
+            position += inotifyEventHeader.size
+            names.append(os.fsdecode(data[position:position + length].rstrip(b'\0')))
+            position += length
+
+def csvSignatures(directory):
+    signatures = {}
+    for entry in os.scandir(directory):
+        if manifest.isSourceFileName(entry.name):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue # Removed since the directory was listed
+            signatures[entry.name] = (st.st_mtime_ns, st.st_size)
+    return signatures
+
+def pollDirectory(directory, pollInterval):
+    signatures = csvSignatures(directory)
+    while True:
+        time.sleep(pollInterval)
+        newSignatures = csvSignatures(directory)
+        if newSignatures != signatures:
+            signatures = newSignatures
+            yield
+
+# Yields once at the start, and again each time CSV files or the manifest in
+# directory change
+def watchDirectory(directory, pollInterval=0.5, settleTime=0.02):
+    yield
+    fd = openInotify(directory)
+    if fd is None:
+        print('Polling', directory, 'for changes')
+        yield from pollDirectory(directory, pollInterval)
+        return
+    try:
+        while True:
+            select.select([fd], [], [])
+            # Give editors that save in several steps time to finish
+            time.sleep(settleTime)
+            names = readInotifyEvents(fd)
+            if any([ manifest.isSourceFileName(name) for name in names ]):
+                yield
+    finally:
+        os.close(fd)
+
+def sourceSignature(sourceFiles):
+    signature = []
+    for sourceFile in sourceFiles:
+        try:
+            st = os.stat(sourceFile)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+# A layout file loaded once, with the sections placed for the source files it
+# was last planned with
+class PlannedLayout:
+    def __init__(self, tree):
+        self.tree = tree
+        self.baseChildren = list(tree.getroot())
+        self.sourceFiles = None
+
+    # Returns the sections and the pieces of the layout text around them
+    def plan(self, inputDir, sourceFiles):
+        if sourceFiles != self.sourceFiles:
+            # CSV files were added or removed, so the sections are placed again
+            self.tree.getroot()[:] = self.baseChildren
+            self.sections = []
+            addSections(self.tree.getroot(), inputDir, sourceFiles, self.sections)
+            self.pieces = splitLayout(self.tree)
+            self.sourceFiles = sourceFiles
+        return self.sections, self.pieces
+
+# Load the sections whose source files have changed since they were rendered.
+# rendered maps the loader function name and arguments of each section to the
+# source signature, the text and the cache key, and is updated. Returns the
+# text of each section and the number of sections loaded. A section that fails
+# to load is not counted.
+def renderChangedSections(sections, rendered, cacheDir=None):
+    texts = []
+    numLoaded = 0
+    currentKeys = set()
+    for section in sections:
+        loaderFunction, loaderArgs, skipMessage, sourceFiles = section
+        key = (loaderFunction.__name__, loaderArgs)
+        currentKeys.add(key)
+        signature = sourceSignature(sourceFiles)
+        if key not in rendered or rendered[key][0] != signature:
+            text, loaded, cacheKey, count = renderSection(section, cacheDir)
+            if loaded:
+                numLoaded += 1
+            else:
+                print(*skipMessage)
+            rendered[key] = (signature, text, cacheKey)
+        texts.append(rendered[key][1])
+    for key in set(rendered) - currentKeys:
+        del rendered[key]
+    return texts, numLoaded
+
+# The cache keys of the fragments of the rendered sections, for pruneCache
+def renderedCacheKeys(rendered):
+    return set([ cacheKey for (signature, text, cacheKey) in rendered.values() if cacheKey is not None ])
+
+# Returns whether the file changed
+def writeRenderedLayout(newFileName, pieces, texts):
+    output = outputfiles.OutputFile(newFileName, 'w', encoding='UTF-8', errors='xmlcharrefreplace')
+    with output as outFile:
+        outFile.write(xmlDeclaration)
+        writeRenderedSections(outFile, pieces, texts, outFile.write)
+    return output.changed
+
+def watch(tree, inputDir, newFileName, cacheDir=None, strict=False):
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+    layout = PlannedLayout(tree)
+    rendered = {}
+    sectionScans = SectionScans(cacheDir)
+    for _ in watchDirectory(inputDir):
+        startTime = time.perf_counter()
+        # A file may be half written or removed while it is read, so a failed
+        # compile is reported and the next change compiled again
+        try:
+            sections, pieces = layout.plan(inputDir, manifest.sourceFiles(inputDir))
+            if not validateSections(sections, sectionScans=sectionScans) and strict:
+                print('Not writing ' + newFileName)
+                continue
+            texts, numLoaded = renderChangedSections(sections, rendered, cacheDir)
+            if cacheDir:
+                pruneCache(cacheDir, renderedCacheKeys(rendered))
+            changed = writeRenderedLayout(newFileName, pieces, texts)
+        except Exception:
+            print('Failed:', repr(sys.exc_info()[1]))
+            continue
+        finally:
+            outputfiles.clearSummary()
+        print('%s %s in %.3f s (%d of %d sections loaded)' % ('Wrote' if changed else 'No changes to',
+            newFileName, time.perf_counter() - startTime, numLoaded, len(sections)))
+
+# Server mode. compile.py --serve listens on a Unix domain socket and keeps the
+# layout files and the text of the sections in memory between requests, so
+# that a compile only parses the layout file again when it changes, and only
+# loads the sections whose CSV files changed, as in watch mode. A change is
+# detected by the modification time and size of the file. Each connection
+# carries one request and one response, each a line of JSON:
+#
+#   { "command": "compile", "layoutFile": "/abs/layout.xml", "csvDir": "/abs/csv/",
+#     "output": null, "strict": false }
+#   { "command": "validate", "csvDir": "/abs/csv/" }
+#
+#   { "status": 0, "messages": "..." }
+#
+# messages is what compile.py would have printed. compileclient.py sends the
+# requests. Requests are served concurrently, one thread per connection.
+
+# Each thread prints to the messages of the request that it is serving
+class ThreadStdout:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def write(self, text):
+        messages = getattr(self.local, 'messages', None)
+        return (messages or self.stdout).write(text)
+
+    def flush(self):
+        self.stdout.flush()
+
+# Each layout file and each CSV directory has its own lock, so that requests
+# for different layout files and CSV directories are served concurrently. The
+# layout lock is held while the layout is parsed and the sections are placed,
+# and the CSV directory lock while the CSV files are validated and loaded.
+class ServerCache:
+    def __init__(self, cacheDir=None):
+        self.cacheDir = cacheDir
+        self.lock = threading.Lock() # For the dictionaries of locks and the pruning of the cache
+        self.layoutLocks = {}
+        self.csvDirLocks = {}
+        self.layouts = {} # Layout file name to its signature and PlannedLayout
+        self.rendered = {} # CSV directory to the rendered sections, as in renderChangedSections
+        self.validations = {} # CSV directory to the signature of the CSV files and the problems
+        self.usedKeys = {} # CSV directory to the cache keys of its rendered sections
+        self.sectionScans = SectionScans(cacheDir)
+
+    def layoutLock(self, layoutFile):
+        with self.lock:
+            return self.layoutLocks.setdefault(layoutFile, threading.Lock())
+
+    def csvDirLock(self, inputDir):
+        with self.lock:
+            return self.csvDirLocks.setdefault(inputDir, threading.Lock())
+
+    # Remove the fragments that no CSV directory uses. The cache directory is
+    # shared by all of them.
+    def pruneCache(self, inputDir, rendered):
+        usedKeys = renderedCacheKeys(rendered)
+        with self.lock:
+            self.usedKeys[inputDir] = usedKeys
+            pruneCache(self.cacheDir, set().union(*self.usedKeys.values()))
+
+    def layout(self, layoutFile):
+        signature = sourceSignature([ layoutFile ])
+        if layoutFile not in self.layouts or self.layouts[layoutFile][0] != signature:
+            self.layouts[layoutFile] = (signature, PlannedLayout(loadBaseLayout(layoutFile)))
+        return self.layouts[layoutFile][1]
+
+    def problems(self, inputDir, sections):
+        sources = sectionSources(sections)
+        fileNames = [ fileName for (objectType, fileName, schemas) in sources ]
+        signature = (fileNames, sourceSignature(fileNames))
+        if inputDir not in self.validations or self.validations[inputDir][0] != signature:
+            self.validations[inputDir] = (signature, sectionProblems(sections, self.sectionScans))
+        return self.validations[inputDir][1]
+
+def serveValidate(cache, request):
+    inputDir = os.path.join(request['csvDir'], '')
+    sections = planSections(inputDir, manifest.sourceFiles(inputDir))
+    with cache.csvDirLock(inputDir):
+        problems = cache.problems(inputDir, sections)
+    for problem in problems:
+        print(problem)
+    print('%d problems found in the CSV files' % len(problems))
+    return 1 if problems else 0
+
+def serveCompile(cache, request):
+    startTime = time.perf_counter()
+    inputDir = os.path.join(request['csvDir'], '')
+    layoutFile = request['layoutFile']
+    newFileName = request.get('output') or outputFileName(layoutFile)
+    sourceFiles = manifest.sourceFiles(inputDir)
+    # plan replaces the sections and pieces rather than changing them, so they
+    # can be used once the lock is released
+    with cache.layoutLock(layoutFile):
+        sections, pieces = cache.layout(layoutFile).plan(inputDir, sourceFiles)
+    with cache.csvDirLock(inputDir):
+        problems = cache.problems(inputDir, sections)
+        for problem in problems:
+            print(problem)
+        if problems:
+            print('%d problems found in the CSV files' % len(problems))
+            if request.get('strict'):
+                print('Not writing ' + newFileName)
+                return 1
+        rendered = cache.rendered.setdefault(inputDir, {})
+        texts, numLoaded = renderChangedSections(sections, rendered, cache.cacheDir)
+        if cache.cacheDir:
+            cache.pruneCache(inputDir, rendered)
+    changed = writeRenderedLayout(newFileName, pieces, texts)
+    print('%s %s in %.3f s (%d of %d sections loaded)' % ('Wrote' if changed else 'No changes to',
+        newFileName, time.perf_counter() - startTime, numLoaded, len(sections)))
+    return 0
+
+serverCommands = {
+    'compile': serveCompile,
+    'validate': serveValidate,
+    }
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        messages = io.StringIO()
+        sys.stdout.local.messages = messages
+        try:
+            request = json.loads(self.rfile.readline())
+            status = serverCommands[request['command']](self.server.cache, request)
+        except:
+            print('Failed:', repr(sys.exc_info()[1]))
+            status = 1
+        finally:
+            sys.stdout.local.messages = None
+        outputfiles.clearSummary()
+        response = { 'status': status, 'messages': messages.getvalue() }
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+def serve(socketPath, cacheDir=None):
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+    # A socket left by a server that did not shut down is replaced, but any
+    # other file is left alone, in case the path was mistyped
+    if os.path.lexists(socketPath):
+        if not stat.S_ISSOCK(os.lstat(socketPath).st_mode):
+            print('Not serving:', socketPath, 'exists and is not a socket')
+            return 1
+        os.remove(socketPath)
+    sys.stdout = ThreadStdout(sys.stdout)
+    server = socketserver.ThreadingUnixStreamServer(socketPath, CompileRequestHandler)
+    server.daemon_threads = True
+    server.cache = ServerCache(cacheDir)
+    print('Serving on', socketPath)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socketPath)
+
+# Batch mode. The sections depend only on the CSV files, so when several layout
+# files are compiled together each section is loaded once and its text is used
+# in all of the layouts.
+
+# Returns the text of each section
+def renderSections(sections, cacheDir=None, jobs=1):
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(renderSection, sections, [cacheDir] * len(sections)))
+    else:
+        results = []
+        for section in sections:
+            loaderFunction, loaderArgs, skipMessage, sourceFiles = section
+            with profiler.phase(loaderFunction.__name__, ' '.join(sourceFiles)) as p:
+                results.append(renderSection(section, cacheDir))
+                p.count = results[-1][3]
+    texts = []
+    usedKeys = set()
+    for (section, (text, loaded, key, count)) in zip(sections, results):
+        if loaded:
+            usedKeys.add(key)
+        else:
+            print(*section[2])
+        texts.append(text)
+    if cacheDir:
+        pruneCache(cacheDir, usedKeys)
+    return texts
+
+# Write the updated file of one layout, given the text of each section
+def writeBatchLayout(layoutFile, inputDir, texts, splice=False):
+    newFileName = outputFileName(layoutFile)
+    if splice:
+        writeSpliced(layoutFile, inputDir, newFileName, texts=texts)
+        return
+    with profiler.phase('parse', layoutFile):
+        tree = loadBaseLayout(layoutFile)
+    sections = []
+    addSections(tree.getroot(), inputDir, manifest.sourceFiles(inputDir), sections)
+    writeStreamed(tree, sections, newFileName, texts=texts)
+
+# Runs in a worker process. Returns the files that changed and the ones that
+# did not, which the main process reports.
+def writeBatchLayoutInWorker(layoutFile, inputDir, texts, splice):
+    writeBatchLayout(layoutFile, inputDir, texts, splice)
+    written = (list(outputfiles.changedFiles), list(outputfiles.unchangedFiles))
+    outputfiles.clearSummary()
+    return written
+
+def compileBatch(layoutFiles, inputDir, cacheDir=None, jobs=1, splice=False):
+    texts = renderSections(planSections(inputDir, manifest.sourceFiles(inputDir)), cacheDir, jobs)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            n = len(layoutFiles)
+            for (changed, unchanged) in executor.map(writeBatchLayoutInWorker, layoutFiles,
+                    [inputDir] * n, [texts] * n, [splice] * n):
+                outputfiles.changedFiles.extend(changed)
+                outputfiles.unchangedFiles.extend(unchanged)
+    else:
+        for layoutFile in layoutFiles:
+            writeBatchLayout(layoutFile, inputDir, texts, splice)
+
+# Load the layout file. The objects that are externally managed are replaced
+# when the sections are added.
+def loadBaseLayout(layoutFile):
+    return xmlbackend.parse(layoutFile)
+
+# The top level elements of a layout in the order that JMRI writes them, as far
+# as the externally managed sections are concerned
+canonicalOrder = [ 'jmriversion', 'sensors', 'turnouts', 'lights', 'reporters', 'memories',
+    'signalheads', 'signalmasts', 'blocks' ]
+managedTags = [ tag for tag in canonicalOrder if tag in loaderTags.values() ]
+
+# Returns the children of the layout with the managed elements of baseChildren
+# replaced by the placed sections. placed is a list of (tag, element) pairs in
+# the order they were loaded. The sections of a tag take the place of the first
+# element with that tag in the base layout. If there is none, they follow the
+# nearest element before them in canonical order, or come first if there is
+# none of those either.
+def orderSections(baseChildren, placed):
+    sectionsByTag = {}
+    for (tag, element) in placed:
+        sectionsByTag.setdefault(tag, []).append(element)
+    baseTags = set([ child.tag for child in baseChildren ])
+    leading = []
+    following = {} # Tag in the base layout to the tags of the sections that follow it
+    for (i, tag) in enumerate(canonicalOrder):
+        if tag in sectionsByTag and tag not in baseTags:
+            earlier = [ t for t in canonicalOrder[:i] if t in baseTags ]
+            if earlier:
+                following.setdefault(earlier[-1], []).append(tag)
+            else:
+                leading.append(tag)
+
+    children = []
+    for tag in leading:
+        children += sectionsByTag[tag]
+    seenTags = set()
+    for child in baseChildren:
+        first = child.tag not in seenTags
+        seenTags.add(child.tag)
+        if child.tag not in managedTags:
+            children.append(child)
+        elif first:
+            children += sectionsByTag.get(child.tag, [])
+        if first:
+            for tag in following.get(child.tag, []):
+                children += sectionsByTag[tag]
+    return children
+
+# Add the sections loaded from the CSV files to the layout, in place of the
+# managed elements of the layout. sourceFiles is the result of
+# manifest.sourceFiles. If sections is a list, placeholders are added instead
+# and the sections are added to it. If tables is given, the files are read from
+# it as in manifest.openRows.
+def addSections(root, inputDir, sourceFiles, sections, tables=None):
+    placed = []
+
+    for sensorFileName in sourceFiles['sensor']:
+        addSection(loadSensorFile, (sensorFileName, tables),
+            ('Skipping loading sensor file ' + sensorFileName,), [sensorFileName], sections, placed)
+
+    for turnoutFileName in sourceFiles['turnout']:
+        addSection(loadTurnoutFile, (turnoutFileName, tables),
+            ('Skipping loading turnout file ' + turnoutFileName,), [turnoutFileName], sections, placed)
+
+    for lightFileName in sourceFiles['light']:
+        addSection(loadLightFile, (lightFileName, tables),
+            ('Skipping loading lights file ', lightFileName), [lightFileName], sections, placed)
+
+    for reporterFileName in sourceFiles['reporter']:
+        addSection(loadReporterFile, (reporterFileName, tables),
+            ('Skipping loading reporter file ' + reporterFileName,), [reporterFileName], sections, placed)
+
+    for signalHeadFileNames in zip(sourceFiles['tripleTurnoutSignalHead'], sourceFiles['singleTurnoutSignalHead']):
+        addSection(loadSignalHeads, signalHeadFileNames + (tables,),
+            ('Skipping loading of signal heads',), list(signalHeadFileNames), sections, placed)
+
+    for signalMastFileName in sourceFiles['signalmast']:
+        addSection(loadSignalMasts, (signalMastFileName, tables),
+            ('Skipping loading signal masts',), [signalMastFileName], sections, placed)
+
+    for blockFileName in sourceFiles['block']:
+        addSection(loadBlocks, (blockFileName, tables),
+            ('Skipping loading blocks',), [blockFileName], sections, placed)
+
+    root[:] = orderSections(list(root), placed)
+
+# The sections that addSections adds for sourceFiles, without a layout
+def planSections(inputDir, sourceFiles, tables=None):
+    sections = []
+    addSections(xmlbackend.Element('layout-config'), inputDir, sourceFiles, sections, tables)
+    return sections
+
+# Library use. The CSV files are given as tables, a dictionary of file name to
+# the text of the file such as extract.extractTables returns, or a
+# database.Database, and nothing is read from the CSV directory or written to
+# disk. layoutFile is a file name or
+# a binary file object. Loading problems are printed as by compileLayout.
+
+# Returns the text of the updated layout file as bytes
+def compileTables(layoutFile, tables):
+    tree = loadBaseLayout(layoutFile)
+    sections = []
+    addSections(tree.getroot(), '', manifest.tableSourceFiles(tables), sections, tables)
+    pieces = splitLayout(tree)
+    outFile = io.StringIO()
+    outFile.write(xmlDeclaration)
+    writeSections(outFile, pieces, sections, outFile.write)
+    return outFile.getvalue().encode('UTF-8', errors='xmlcharrefreplace')
+
+# Returns the problems found in the names and references of the tables
+def validateTables(tables):
+    sections = planSections('', manifest.tableSourceFiles(tables), tables)
+    return validate.validate(sectionSources(sections), tables)
+
+# The name is split at its first dot, and the directory is left as it is
+def outputFileName(layoutFile):
+    directory, name = os.path.split(layoutFile)
+    comps = name.split('.')
+    return os.path.join(directory, comps[0] + '_updated.' + comps[1])
+
+def compileLayout(args):
+    if args.serve:
+        return serve(args.serve, args.cacheDir)
+    # Load the reduced XML file
+    inputDir = args.csvDir
+    if not inputDir.endswith('/'):
+        inputDir = inputDir + '/'
+    layoutFile = args.layoutFile[0]
+    newFileName = args.output or outputFileName(layoutFile)
+    # With --database, the CSV files are read from the database as tables
+    tables = None
+    sourceFiles = None
+    if args.database:
+        tables = database.Database(args.database)
+        sourceFiles = manifest.tableSourceFiles(tables)
+    elif not args.watch:
+        sourceFiles = manifest.sourceFiles(inputDir)
+
+    if not args.watch:
+        with profiler.phase('validate', args.database or inputDir):
+            valid = validateSections(planSections(inputDir, sourceFiles, tables), tables, SectionScans(args.cacheDir))
+        if not valid and args.strict:
+            print('Not writing ' + ', '.join([ args.output or outputFileName(f) for f in args.layoutFile ]))
+            return 1
+
+    if len(args.layoutFile) > 1:
+        compileBatch(args.layoutFile, inputDir, args.cacheDir, args.jobs, args.splice)
+        return
+
+    if args.splice:
+        writeSpliced(layoutFile, inputDir, newFileName, args.cacheDir, args.jobs, tables=tables)
+        return
+
+    with profiler.phase('parse', layoutFile) as p:
+        tree = loadBaseLayout(layoutFile)
+        root = tree.getroot()
+        p.count = len(root)
+
+    if args.watch:
+        try:
+            watch(tree, inputDir, newFileName, args.cacheDir, args.strict)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # The sections are built with ElementTree, so they can only be inserted into
+    # an ElementTree layout. With lxml they are always streamed.
+    streaming = args.stream or args.cacheDir is not None or args.jobs > 1 or xmlbackend.backend == 'lxml'
+    sections = [] if streaming else None # Loaders waiting to be streamed
+    addSections(root, inputDir, sourceFiles, sections, tables)
+
+    if sections is not None:
+        writeStreamed(tree, sections, newFileName, args.cacheDir, args.jobs)
+    else:
+        with profiler.phase('indent', newFileName):
+            ET.indent(tree)
+        with profiler.phase('write', newFileName), outputfiles.OutputFile(newFileName, 'wb') as outFile:
+            tree.write(outFile, xml_declaration=True, encoding='UTF-8')
+
+def main(args):
+    if args.xmlBackend:
+        xmlbackend.useBackend(args.xmlBackend)
+    profiling.enableIfRequested(profiler, args)
+    # When the layout is written to standard output, messages go to standard error
+    toStandardOutput = args.output == outputfiles.standardOutput
+    with contextlib.redirect_stdout(sys.stderr if toStandardOutput else sys.stdout):
+        status = compileLayout(args)
+        outputfiles.printSummary()
+        profiler.report(args)
+    return status
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Deconstruct a JMRI XML formatted layout description file')
     parser.add_argument('--csvDir', type=str, default='.', help='Directory containing the CSV files.')
-    parser.add_argument('layoutFile', type=str, help='JMRI layout description file in XML format')
+    parser.add_argument('--database', type=str, default=None,
+        help='SQLite database written by extract.py --database to read the CSV files from, instead of --csvDir')
+    parser.add_argument('--stream', action='store_true', help='Write the managed sections straight to the output file instead of building them in memory')
+    parser.add_argument('--cacheDir', type=str, default=None, help='Directory in which to cache the compiled sections of unchanged CSV files. Implies --stream.')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes used to load the CSV files. Implies --stream.')
+    parser.add_argument('--splice', action='store_true', help='Copy the parts of the layout file that are not externally managed unchanged, without parsing them')
+    parser.add_argument('--watch', action='store_true', help='Keep running and compile again whenever a CSV file changes')
+    parser.add_argument('--strict', action='store_true', help='Do not write the layout file if the CSV files have duplicate names or references to unknown objects')
+    parser.add_argument('--output', type=str, default=None,
+        help='File to write the updated layout to, instead of the layout file name with _updated added. '
+        '- writes it to standard output. A name ending in .gz or .xz is compressed.')
+    parser.add_argument('--serve', type=str, default=None, metavar='SOCKET',
+        help='Serve compile and validate requests from compileclient.py on this Unix domain socket')
+    parser.add_argument('layoutFile', type=str, nargs='*',
+        help='JMRI layout description files in XML format. The CSV files are loaded once for all of them.')
+    xmlbackend.addBackendArgument(parser)
+    profiling.addProfileArguments(parser)
     args = parser.parse_args()
+    if not args.layoutFile and not args.serve:
+        parser.error('a layout file is required')
+    if args.watch and len(args.layoutFile) > 1:
+        parser.error('--watch takes a single layout file')
+    if args.output and len(args.layoutFile) > 1:
+        parser.error('--output takes a single layout file')
+    if args.watch and args.output == outputfiles.standardOutput:
+        parser.error('--watch cannot write to standard output')
+    # Watch and server mode render the sections one at a time into the whole layout
+    if args.watch and (args.splice or args.jobs > 1):
+        parser.error('--watch cannot be used with --splice or --jobs')
+    if args.serve and (args.watch or args.splice or args.jobs > 1):
+        parser.error('--serve cannot be used with --watch, --splice or --jobs')
+    if args.database and (args.watch or args.serve or args.cacheDir or args.jobs > 1 or len(args.layoutFile) > 1):
+        parser.error('--database takes a single layout file, and cannot be used with --watch, --serve, --cacheDir or --jobs')
 
-    main(args)
+    sys.exit(main(args))
\ No newline at end of file
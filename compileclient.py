@@ -0,0 +1,50 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Sends a compile or validate request to compile.py --serve, prints what the
+# server printed for it and exits with its status. Only the standard library is
+# imported, so the client starts quickly.
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+def sendRequest(socketPath, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socketPath)
+        connection.sendall((json.dumps(request) + '\n').encode())
+        with connection.makefile('rb') as responseFile:
+            return json.loads(responseFile.readline())
+
+def main(args):
+    # The server may run in another directory
+    request = { 'command': 'validate' if args.validate else 'compile', 'csvDir': os.path.abspath(args.csvDir) }
+    if not args.validate:
+        request['layoutFile'] = os.path.abspath(args.layoutFile)
+        request['output'] = os.path.abspath(args.output) if args.output else None
+        request['strict'] = args.strict
+    response = sendRequest(args.socket, request)
+    sys.stdout.write(response['messages'])
+    return response['status']
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile a layout with a running compile.py --serve')
+    parser.add_argument('--socket', type=str, required=True, help='Unix domain socket that the server listens on')
+    parser.add_argument('--csvDir', type=str, default='.', help='Directory containing the CSV files.')
+    parser.add_argument('--output', type=str, default=None,
+        help='File to write the updated layout to, instead of the layout file name with _updated added. '
+        'A name ending in .gz or .xz is compressed.')
+    parser.add_argument('--strict', action='store_true', help='Do not write the layout file if the CSV files have duplicate names or references to unknown objects')
+    parser.add_argument('--validate', action='store_true', help='Only check the names and references in the CSV files')
+    parser.add_argument('layoutFile', type=str, nargs='?', help='JMRI layout description file in XML format')
+    args = parser.parse_args()
+    if not args.validate and not args.layoutFile:
+        parser.error('a layout file is required')
+    if args.output == '-':
+        parser.error('the server cannot write to standard output')
+
+    sys.exit(main(args))
@@ -0,0 +1,32 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Layout and CSV files may be compressed with gzip or xz. They are recognized
+# by their contents rather than their names, and decompressed as they are read.
+
+import gzip
+import lzma
+
+gzipMagic = b'\x1f\x8b'
+xzMagic = b'\xfd7zXZ\x00'
+
+# Returns the module that decompresses fileName, or None if it is not compressed
+def compressionOf(fileName):
+    with open(fileName, 'rb') as inputFile:
+        head = inputFile.read(len(xzMagic))
+    if head.startswith(gzipMagic):
+        return gzip
+    if head.startswith(xzMagic):
+        return lzma
+    return None
+
+# Open a file for reading as open does, decompressing it if it is compressed
+def openInput(fileName, mode='r', **kwargs):
+    module = compressionOf(fileName)
+    if module is None:
+        return open(fileName, mode, **kwargs)
+    if 'b' not in mode:
+        mode = 'rt'
+    return module.open(fileName, mode, **kwargs)
@@ -0,0 +1,216 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# A SQLite database that takes the place of the CSV directory, written by
+# extract.py --database and read by compile.py --database. It holds the same
+# files as the directory would, one table per file type:
+#
+#   manifest   the manifest entries: position, file, type, class, rows, sha256
+#   properties name and value, of which layoutFile is the extracted layout
+#   otherRows  the header, class and settings rows of every file: file, line,
+#              kind and the cells after the row kind as a JSON list
+#   sensor, turnout, ... one table for each file type in manifest.fileTypes,
+#              with the object rows of its files: file, line, kind, and a
+#              column for each column of the schema, indexed on systemName
+#              and userName
+#
+# line is the line number of the row in the CSV file, so a file is read back
+# row for row and the hash in the manifest is the hash of the CSV text. The
+# object tables can be queried directly, as in
+#
+#   sqlite3 layout.db "SELECT systemName FROM turnout WHERE feedback = 'ONESENSOR' AND file LIKE 'turnout_cmri_%'"
+
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import manifest
+import schema
+
+# The schemas of the object rows of each file type, by row kind
+fileSchemas = {
+    'sensor': { 'sensor': schema.sensorSchema },
+    'turnout': { 'turnout': schema.turnoutSchema },
+    'light': { 'light': schema.lightSchema },
+    'reporter': { 'reporter': schema.reporterSchema },
+    'tripleTurnoutSignalHead': { 'signalhead': schema.tripleTurnoutSignalHeadSchema },
+    'singleTurnoutSignalHead': { 'signalhead': schema.singleTurnoutSignalHeadSchema },
+    'signalmast': schema.signalMastSchemas,
+    'block': { 'block': schema.blockSchema },
+    }
+
+# The schemas of a file type share their columns
+def columnNames(fileType):
+    return next(iter(fileSchemas[fileType].values())).columnNames()
+
+def quoted(name):
+    return '"%s"' % name
+
+def createTables(connection):
+    connection.execute('CREATE TABLE manifest (position INTEGER PRIMARY KEY, file TEXT, type TEXT, class TEXT, rows INTEGER, sha256 TEXT)')
+    connection.execute('CREATE TABLE properties (name TEXT PRIMARY KEY, value TEXT)')
+    connection.execute('CREATE TABLE otherRows (file TEXT, line INTEGER, kind TEXT, cells TEXT)')
+    connection.execute('CREATE INDEX otherRows_file ON otherRows (file, line)')
+    for fileType in fileSchemas:
+        columns = ''.join([ ', %s TEXT' % quoted(c) for c in columnNames(fileType) ])
+        connection.execute('CREATE TABLE %s (file TEXT, line INTEGER, kind TEXT%s)' % (quoted(fileType), columns))
+        for column in ('file', 'systemName', 'userName'):
+            connection.execute('CREATE INDEX %s ON %s (%s)' % (quoted(fileType + '_' + column), quoted(fileType),
+                'file, line' if column == 'file' else quoted(column)))
+
+# Writes the rows of one file. The rows are also written as CSV text, which
+# gives their line numbers and the hash of the file.
+class RowWriter:
+    def __init__(self, connection, fileName, fileType):
+        self.connection = connection
+        self.fileName = fileName
+        self.schemas = fileSchemas[fileType]
+        self.numColumns = len(columnNames(fileType))
+        self.insertObject = 'INSERT INTO %s VALUES (?, ?, ?%s)' % (quoted(fileType), ', ?' * self.numColumns)
+        self.text = io.StringIO()
+        self.csvWriter = csv.writer(self.text)
+        self.sha256 = hashlib.sha256()
+        self.line = 0
+
+    def writerow(self, row):
+        self.csvWriter.writerow(row)
+        text = self.text.getvalue()
+        self.text.seek(0)
+        self.text.truncate()
+        self.sha256.update(text.encode())
+        self.line += text.count('\n')
+        cells = [ '' if c is None else str(c) for c in row[1:] ]
+        if row[0] in self.schemas and len(cells) == self.numColumns:
+            self.connection.execute(self.insertObject, [ self.fileName, self.line, row[0] ] + cells)
+        else:
+            self.connection.execute('INSERT INTO otherRows VALUES (?, ?, ?, ?)',
+                (self.fileName, self.line, row[0] if len(row) > 0 else None, json.dumps(cells)))
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+# An output for extract.py, in place of the CSV directory. The database is
+# written to a temporary file that replaces fileName when it is closed, so a
+# failed extract leaves the previous database in place. When only some of the
+# sections are extracted, replacedTypes are the types of their files. The
+# previous database is then copied, and only the files of those types replaced.
+class DatabaseOutput:
+    def __init__(self, fileName, replacedTypes=None):
+        self.fileName = fileName
+        self.tempFileName = '%s.%d.tmp' % (fileName, os.getpid())
+        self.manifestEntries = []
+        self.previousEntries = None
+        self.replacedTypes = replacedTypes
+        self.hashes = {}
+        if os.path.exists(self.tempFileName):
+            os.remove(self.tempFileName)
+        if replacedTypes is not None and os.path.exists(fileName):
+            shutil.copyfile(fileName, self.tempFileName)
+            self.connection = sqlite3.connect(self.tempFileName)
+            self.removeFiles(replacedTypes)
+        else:
+            self.connection = sqlite3.connect(self.tempFileName)
+            createTables(self.connection)
+
+    # Remove the files of fileTypes, and the manifest, which writeManifest
+    # writes again from the previous entries
+    def removeFiles(self, fileTypes):
+        self.previousEntries = [ { 'file': f, 'type': t, 'class': c, 'rows': r, 'sha256': h } for (f, t, c, r, h) in
+            self.connection.execute('SELECT file, type, class, rows, sha256 FROM manifest ORDER BY position') ]
+        for entry in self.previousEntries:
+            if entry['type'] in fileTypes:
+                self.connection.execute('DELETE FROM otherRows WHERE file = ?', (entry['file'],))
+                self.connection.execute('DELETE FROM %s WHERE file = ?' % quoted(entry['type']), (entry['file'],))
+        self.connection.execute('DELETE FROM manifest')
+        self.connection.execute('DELETE FROM properties')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.connection.commit()
+        self.connection.close()
+        if excType is None:
+            os.replace(self.tempFileName, self.fileName)
+            print('Wrote %d files to %s' % (len(self.manifestEntries), self.fileName))
+        else:
+            os.remove(self.tempFileName)
+
+    @contextlib.contextmanager
+    def rows(self, fileName, fileType):
+        writer = RowWriter(self.connection, fileName, fileType)
+        yield writer
+        self.hashes[fileName] = writer.sha256.digest()
+
+    def hash(self, fileName):
+        return self.hashes[fileName]
+
+    def writeManifest(self, layoutFileName):
+        entries = self.manifestEntries
+        if self.previousEntries is not None:
+            entries = manifest.mergeEntries(self.previousEntries, entries, self.replacedTypes)
+        self.connection.execute('INSERT INTO properties VALUES (?, ?)', ('layoutFile', layoutFileName))
+        self.connection.executemany('INSERT INTO manifest VALUES (?, ?, ?, ?, ?, ?)',
+            [ (i, e['file'], e['type'], e['class'], e['rows'], e['sha256']) for (i, e) in enumerate(entries) ])
+
+# The rows of a file, as a CSV reader returns them, with line_num the line
+# number of the last row returned. objectRows are the (line, kind, columns...)
+# rows of the object table and otherRows the (line, row) pairs of the other
+# rows, both in line order. An object row is returned as a tuple.
+class RowReader:
+    def __init__(self, objectRows, otherRows):
+        self.objectRows = objectRows
+        self.otherRows = otherRows
+        self.nextObjectRow = next(objectRows, None)
+        self.line_num = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.otherRows and (self.nextObjectRow is None or self.otherRows[-1][0] < self.nextObjectRow[0]):
+            self.line_num, row = self.otherRows.pop()
+            return row
+        row = self.nextObjectRow
+        if row is None:
+            raise StopIteration
+        self.nextObjectRow = next(self.objectRows, None)
+        self.line_num = row[0]
+        return row[1:]
+
+# A database to compile from. It is passed to compile.py as its tables, in
+# place of the dictionary of file texts; see manifest.openRows.
+class Database:
+    def __init__(self, fileName):
+        if not os.path.exists(fileName):
+            raise OSError('No such database: ' + fileName)
+        self.connection = sqlite3.connect(fileName)
+        self.fileTypes = dict(self.connection.execute('SELECT file, type FROM manifest'))
+
+    def close(self):
+        self.connection.close()
+
+    def sourceFiles(self):
+        entries = self.connection.execute('SELECT file, type FROM manifest ORDER BY position')
+        return manifest.listedSourceFiles([ { 'file': f, 'type': t } for (f, t) in entries ])
+
+    # Raises KeyError for a file that is not in the database, as a dictionary of
+    # tables would
+    @contextlib.contextmanager
+    def openRows(self, fileName):
+        fileType = self.fileTypes[fileName]
+        columns = ''.join([ ", ifnull(%s, '')" % quoted(c) for c in columnNames(fileType) ])
+        objectRows = self.connection.execute('SELECT line, kind%s FROM %s WHERE file = ? ORDER BY line' %
+            (columns, quoted(fileType)), (fileName,))
+        # The other rows are few, and are kept in reverse order to be popped
+        otherRows = [ (line, ([] if kind is None else [ kind ]) + json.loads(cells)) for (line, kind, cells) in
+            self.connection.execute('SELECT line, kind, cells FROM otherRows WHERE file = ? ORDER BY line DESC', (fileName,)) ]
+        yield RowReader(objectRows, otherRows)
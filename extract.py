@@ -7,14 +7,21 @@ import xml.etree.ElementTree as ET
 import csv
 import re
 import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import database
+import layoutscan
+import manifest
+import outputfiles
+import profiling
+import schema
+import xmlbackend
 
-# This pattern occurs repeatedly
-def getOptionalElement(parent, tagname):
-    x = parent.find(tagname)
-    if x != None:
-        return x.text
-    else:
-        return ''
+profiler = profiling.Profiler()
 
 def getFileName(objectsX, objectName):
     className = objectsX.attrib['class']
@@ -38,79 +45,141 @@ def getFileName(objectsX, objectName):
     else:
         return objectName + '_' + connectionType + '_' + busName + ".csv"
 
-def extractReporters(reportersX, outputDir):
+# Converters from XML elements to CSV rows, generated from the schemas
+sensorToRow = schema.elementToRowFunction(schema.sensorSchema)
+turnoutToRow = schema.elementToRowFunction(schema.turnoutSchema)
+lightToRow = schema.elementToRowFunction(schema.lightSchema)
+reporterToRow = schema.elementToRowFunction(schema.reporterSchema)
+tripleTurnoutSignalHeadToRow = schema.elementToRowFunction(schema.tripleTurnoutSignalHeadSchema)
+singleTurnoutSignalHeadToRow = schema.elementToRowFunction(schema.singleTurnoutSignalHeadSchema)
+signalMastToRow = schema.elementToRowFunction(schema.signalMastSchemas['signalmast'])
+# Block elements are present in duplicate to break circularity in the code.
+# Only the instance with the permissive child element is converted.
+blockToRow = schema.elementToRowFunction(schema.blockSchema, requiredTag='permissive')
+
+# The CSV files are written to an output, which is either a directory, a
+# dictionary of tables, of file name to the text of the file, or a database
+# (database.DatabaseOutput). rows returns a context manager for a CSV writer of
+# a file of the given type, and hash returns the hash of a written file.
+# manifestEntries are the files written, for the manifest. Each is a dictionary
+# with the file name relative to the CSV directory, the type of object in it,
+# the class of the manager of the section, the number of object rows and the
+# hash of the file. open returns a context manager for writing a text file.
+# When only some of the sections are extracted, replacedTypes are the types of
+# their files, and the previous manifest is updated rather than replaced.
+class CsvOutput:
+    previousEntries = None
+    replacedTypes = None
+
+    @contextlib.contextmanager
+    def rows(self, fileName, fileType):
+        with self.open(fileName) as outFile:
+            yield csv.writer(outFile)
+
+    # The manifest lists the CSV files for compile
+    def writeManifest(self, layoutFileName):
+        entries = self.manifestEntries
+        if self.replacedTypes is not None:
+            if self.previousEntries is None:
+                print('No manifest to update, so compile finds the CSV files by their names')
+                return
+            entries = manifest.mergeEntries(self.previousEntries, entries, self.replacedTypes)
+        with self.open(manifest.manifestFileName) as outFile:
+            json.dump({ 'layoutFile': layoutFileName, 'files': entries }, outFile, indent=2)
+            outFile.write('\n')
+
+class DirectoryOutput(CsvOutput):
+    def __init__(self, outputDir, replacedTypes=None):
+        self.outputDir = outputDir
+        self.manifestEntries = []
+        self.replacedTypes = replacedTypes
+        if replacedTypes is not None and os.path.exists(outputDir + manifest.manifestFileName):
+            with open(outputDir + manifest.manifestFileName, 'r') as inputFile:
+                self.previousEntries = json.load(inputFile)['files']
+
+    def open(self, fileName):
+        return outputfiles.OutputFile(self.outputDir + fileName, 'w')
+
+    def hash(self, fileName):
+        return outputfiles.fileHash(self.outputDir + fileName)
+
+class TableOutput(CsvOutput):
+    def __init__(self):
+        self.tables = {}
+        self.manifestEntries = []
+
+    @contextlib.contextmanager
+    def open(self, fileName):
+        outFile = io.StringIO()
+        yield outFile
+        self.tables[fileName] = outFile.getvalue()
+
+    def hash(self, fileName):
+        return hashlib.sha256(self.tables[fileName].encode()).digest()
+
+def addManifestEntry(output, fileName, fileType, sectionX, numRows):
+    output.manifestEntries.append({ 'file': fileName, 'type': fileType, 'class': sectionX.attrib.get('class', ''),
+        'rows': numRows, 'sha256': output.hash(fileName).hex() })
+
+def extractReporters(reportersX, output):
     reporterFileName = getFileName(reportersX, 'reporter')
     if reporterFileName:
-        with open(outputDir + reporterFileName, 'w') as outFile:
-            tablewriter = csv.writer(outFile)
-            headings = [ 'Columns', 'System name', 'User name', 'Comment']
-            tablewriter.writerow(headings)
+        numRows = 0
+        with output.rows(reporterFileName, 'reporter') as tablewriter:
+            tablewriter.writerow(schema.reporterSchema.headings())
             row = [ 'class', reportersX.attrib['class'] ]
             tablewriter.writerow(row)
             for reporterX in reportersX:
                 if reporterX.tag == 'reporter':
-                    systemName = ''
-                    userName = ''
-                    comment = ''
-                    for t in reporterX:
-                        if t.tag == 'systemName':
-                            systemName = t.text
-                        elif t.tag == 'userName':
-                            userName = t.text
-                        elif t.tag == 'comment':
-                            comment = t.text
-                    tablewriter.writerow(['reporter', systemName, userName, comment])
+                    tablewriter.writerow(reporterToRow(reporterX))
+                    numRows += 1
+        addManifestEntry(output, reporterFileName, 'reporter', reportersX, numRows)
     else:
         print('Could not determine file name for reporters')
 
-def extractSensors(sensorsX, outputDir):
+def extractSensors(sensorsX, output):
     sensorFileName = getFileName(sensorsX, 'sensor')
     if sensorFileName:
-        with open(outputDir + sensorFileName, 'w') as outFile:
-            tablewriter = csv.writer(outFile)
-            headings = ['Columns',  'System name', 'User name', 'Inverted', 'Comment', 'Use global debounce timer' ]
-            tablewriter.writerow(headings)
+        numRows = 0
+        with output.rows(sensorFileName, 'sensor') as tablewriter:
+            tablewriter.writerow(schema.sensorSchema.headings())
             row = [ 'class', sensorsX.attrib['class']]
             tablewriter.writerow(row)
-            gdt = sensorsX.find('globalDebounceTimers')
             for sensorX in sensorsX:
-                if sensorX.tag == 'defaultInitialState':
+                if sensorX.tag == "sensor":
+                    tablewriter.writerow(sensorToRow(sensorX))
+                    numRows += 1
+                elif sensorX.tag == 'defaultInitialState':
                     row = [ 'defaultInitialState', sensorX.text ]
                     tablewriter.writerow(row)
                 elif sensorX.tag == 'globalDebounceTimers':
                     row = [ 'globalDebounceTimers', sensorX.find('goingActive').text, sensorX.find('goingInActive').text]
                     tablewriter.writerow(row)
-                elif sensorX.tag == "sensor":
-                    inverted = 'false'
-                    if 'inverted' in sensorX.attrib:
-                        inverted = sensorX.attrib['inverted']
-                    systemName = ''
-                    userName = ''
-                    comment = ''
-                    useGlobalDebounceTimer = ''
-                    for t in sensorX:
-                        if t.tag == 'systemName':
-                            systemName = t.text
-                        elif t.tag == 'userName':
-                            userName = t.text
-                        elif t.tag == 'comment':
-                            comment = t.text
-                        elif t.tag == 'useGlobalDebounceTimer':
-                            useGlobalDebounceTimer = t.text
-                    tablewriter.writerow(['sensor', systemName, userName, inverted, comment, useGlobalDebounceTimer])
+        addManifestEntry(output, sensorFileName, 'sensor', sensorsX, numRows)
     else:
         print('Could not determine file name for sensors')
 
-def extractTurnouts(turnoutsX, outputDir):
+# The settings of the turnout manager, in the order their rows are written.
+# Only the first element with each tag is used.
+turnoutSettingTags = [ 'operations', 'defaultclosedspeed', 'defaultthrownspeed' ]
+
+def extractTurnouts(turnoutsX, output):
     turnoutFileName = getFileName(turnoutsX, 'turnout')
     if turnoutFileName:
-        with open(outputDir + turnoutFileName, 'w') as outFile:
-            tablewriter = csv.writer(outFile)
-            headings = ['Columns',  'System name', 'User name', 'Comment', 'Feedback', 'Sensor 1', 'Sensor 2', 'Inverted', 'Control type', 'Automate', 'Reverse speed', 'Normal speed' ]
-            tablewriter.writerow(headings)
+        # The settings rows come first, wherever the settings are in the section,
+        # so the section is read in one pass before anything is written
+        settings = {}
+        turnoutRows = []
+        for child in turnoutsX:
+            if child.tag == 'turnout':
+                turnoutRows.append(turnoutToRow(child))
+            elif child.tag in turnoutSettingTags and child.tag not in settings:
+                settings[child.tag] = child
+        with output.rows(turnoutFileName, 'turnout') as tablewriter:
+            tablewriter.writerow(schema.turnoutSchema.headings())
             row = [ 'class', turnoutsX.attrib['class']]
             tablewriter.writerow(row)
-            ops = turnoutsX.find('operations')
+            ops = settings.get('operations')
             if ops != None:
                 if ops.attrib['automate'] != None:
                     row = [ 'operations_automate', ops.attrib['automate']]
@@ -118,195 +187,75 @@ def extractTurnouts(turnoutsX, outputDir):
                 for op in ops:
                     row = [ 'operations', op.attrib['name'], op.attrib['class'], op.attrib['interval'], op.attrib['maxtries']]
                     tablewriter.writerow(row)
-            dcs = turnoutsX.find('defaultclosedspeed')
+            dcs = settings.get('defaultclosedspeed')
             if dcs != None:
                 row = [ 'defaultclosedspeed', dcs.text]
                 tablewriter.writerow(row)
-            dts = turnoutsX.find('defaultthrownspeed')
+            dts = settings.get('defaultthrownspeed')
             if dts != None:
                 row = [ 'defaultthrownspeed', dts.text]
                 tablewriter.writerow(row)
-            for turnoutX in turnoutsX:
-                if turnoutX.tag == "turnout":
-                    systemName = turnoutX.find('systemName').text
-
-                    # User name is optional
-                    userName = ''
-                    userNameX = turnoutX.find('userName')
-                    if userNameX != None:
-                        userName = userNameX.text
-
-                    # Comment is optional
-                    comment = ''
-                    commentX = turnoutX.find('comment')
-                    if commentX != None:
-                        comment = commentX.text
-
-                    # sensor1 is optional
-                    sensor1 = ''
-                    if 'sensor1' in turnoutX.attrib:
-                        sensor1 = turnoutX.attrib['sensor1']
-                    
-                    # sensor2 is optional
-                    sensor2 = ''
-                    if 'sensor2' in turnoutX.attrib:
-                        sensor2 = turnoutX.attrib['sensor2']
-
-                    # controlType is optional
-                    controlType = ''
-                    if 'controlType' in turnoutX.attrib:
-                        controlType = turnoutX.attrib['controlType']
-
-                    divergingSpeed = ''
-                    divergingSpeedX = turnoutX.find('divergingSpeed')
-                    if divergingSpeedX != None:
-                        divergingSpeed = divergingSpeedX.text
-                    
-                    straightSpeed = ''
-                    straightSpeedX = turnoutX.find('straightSpeed')
-                    if straightSpeedX != None:
-                        straightSpeed = straightSpeedX.text
-
-                    #propertiesL = []
-                    #propertiesX = turnoutX.find('properties')
-                    #if propertiesX != None:
-                    #    for propertyX in propertiesX:
-                    #        key = propertyX.find('key').text
-                    #        value = propertyX.find('value').text
-                    #        propertiesL.append((key,value))
-                    #properties = str(propertiesL)
-
-                    row = [ 'turnout',                  # 0
-                        systemName,                     # 1
-                        userName,                       # 2
-                        comment,                        # 3
-                        turnoutX.attrib['feedback'],    # 4
-                        sensor1,                        # 5
-                        sensor2,                        # 6
-                        turnoutX.attrib['inverted'],    # 7
-                        controlType,                    # 8
-                        turnoutX.attrib['automate'],    # 9
-                        divergingSpeed,                 # 10
-                        straightSpeed                   # 11
-                        ]
-                    tablewriter.writerow(row)
+            tablewriter.writerows(turnoutRows)
+        addManifestEntry(output, turnoutFileName, 'turnout', turnoutsX, len(turnoutRows))
 
-def extractLights(lightsX, outputDir):
+def extractLights(lightsX, output):
     lightFileName = getFileName(lightsX, 'light')
     if lightFileName:
-        with open(outputDir + lightFileName, 'w') as outFile:
-            tablewriter = csv.writer(outFile)
-            headings = ['Columns', 'System name', 'User name', 'Comment', 'Min intensity', 'Max intensity', 'Transition time', 'Control type', 'Control sensor', 'Sensor sense']
-            tablewriter.writerow(headings)
+        with output.rows(lightFileName, 'light') as tablewriter:
+            tablewriter.writerow(schema.lightSchema.headings())
             row = [ 'class', lightsX.attrib['class']]
             tablewriter.writerow(row)
             for lightX in lightsX:
-                systemName = lightX.find('systemName').text
-                userName = getOptionalElement(lightX, 'userName')
-                comment = getOptionalElement(lightX, 'comment')
-                controlType = ''
-                controlSensor = ''
-                sensorSense = ''
-                lightcontrolX = lightX.find('lightcontrol')
-                if lightcontrolX != None:
-                    controlType = lightcontrolX.attrib['controlType']
-                    controlSensor = lightcontrolX.attrib['controlSensor']
-                    sensorSense = lightcontrolX.attrib['sensorSense']
-                minIntensity = lightX.attrib['minIntensity']
-                maxIntensity = lightX.attrib['maxIntensity']
-                transitionTime = lightX.attrib['transitionTime']
-                row = ['light', systemName, userName, comment, minIntensity, maxIntensity, transitionTime, controlType, controlSensor, sensorSense]
-                tablewriter.writerow(row)
+                tablewriter.writerow(lightToRow(lightX))
+        addManifestEntry(output, lightFileName, 'light', lightsX, len(lightsX))
 
-def extractSignalHeads(signalHeadsX, outputDir):
-    with open(outputDir + 'signalheads_tripleturnout.csv', 'w') as outFile:
-        tablewriter = csv.writer(outFile)
-        row = [ 'Columns', 'System name', 'User name', 'Comment', 'Green', 'Yellow', 'Red' ]
-        tablewriter.writerow(row)
-        row = [ 'class', signalHeadsX.attrib['class']]
-        tablewriter.writerow(row)
-        for signalHeadX in signalHeadsX:
-            cl = signalHeadX.attrib['class']
-            if cl == 'jmri.implementation.configurexml.TripleTurnoutSignalHeadXml':
-                systemName = signalHeadX.find('systemName').text
-                userName = getOptionalElement(signalHeadX, 'userName')
-                comment = getOptionalElement(signalHeadX, 'comment')
-                green = ''
-                yellow = ''
-                red = ''
-                for child in signalHeadX:
-                    if child.tag == 'turnoutname':
-                        if child.attrib['defines'] == 'red':
-                            red = child.text
-                        elif child.attrib['defines'] == 'yellow':
-                            yellow = child.text
-                        elif child.attrib['defines'] == 'green':
-                            green = child.text
-                row = [ 'signalhead', systemName, userName, comment, green, yellow, red ]
-                tablewriter.writerow(row)
-    with open(outputDir + 'signalheads_singleturnout.csv', 'w') as outFile:
-        tablewriter = csv.writer(outFile)
-        row = [ 'Columns', 'System name', 'User name', 'Comment', 'Thrown', 'Closed', 'Aspect' ]
-        tablewriter.writerow(row)
-        row = [ 'class', signalHeadsX.attrib['class']]
-        tablewriter.writerow(row)
+# The files of the signal heads, by class: the file name, the file type, the
+# schema and the converter
+signalHeadFiles = {
+    schema.tripleTurnoutSignalHeadClass: ('signalheads_tripleturnout.csv', 'tripleTurnoutSignalHead',
+        schema.tripleTurnoutSignalHeadSchema, tripleTurnoutSignalHeadToRow),
+    schema.singleTurnoutSignalHeadClass: ('signalheads_singleturnout.csv', 'singleTurnoutSignalHead',
+        schema.singleTurnoutSignalHeadSchema, singleTurnoutSignalHeadToRow),
+    }
+
+# Each signal head is written to the file of its class in a single pass
+def extractSignalHeads(signalHeadsX, output):
+    writers = {}
+    numRows = {}
+    with contextlib.ExitStack() as files:
+        for (className, (fileName, fileType, objectSchema, toRow)) in signalHeadFiles.items():
+            tablewriter = files.enter_context(output.rows(fileName, fileType))
+            tablewriter.writerow(objectSchema.headings())
+            row = [ 'class', signalHeadsX.attrib['class']]
+            tablewriter.writerow(row)
+            writers[className] = (tablewriter.writerow, toRow)
+            numRows[className] = 0
         for signalHeadX in signalHeadsX:
-            cl = signalHeadX.attrib['class']
-            if cl == 'jmri.implementation.configurexml.SingleTurnoutSignalHeadXml':
-                systemName = signalHeadX.find('systemName').text
-                userName = getOptionalElement(signalHeadX, 'userName')
-                comment = getOptionalElement(signalHeadX, 'comment')
-                thrown = ''
-                closed = ''
-                aspect = ''
-                for child in signalHeadX:
-                    if child.tag == 'appearance':
-                        if child.attrib['defines'] == 'thrown':
-                            thrown = child.text
-                        elif child.attrib['defines'] == 'closed':
-                            closed = child.text
-                    elif child.tag == 'turnoutname':
-                        if child.attrib['defines'] == 'aspect':
-                            aspect = child.text
-                row = [ 'signalhead', systemName, userName, comment, thrown, closed, aspect ]
-                tablewriter.writerow(row)
-            
+            className = signalHeadX.attrib['class']
+            writer = writers.get(className)
+            if writer is not None:
+                writerow, toRow = writer
+                writerow(toRow(signalHeadX))
+                numRows[className] += 1
+    for (className, (fileName, fileType, objectSchema, toRow)) in signalHeadFiles.items():
+        addManifestEntry(output, fileName, fileType, signalHeadsX, numRows[className])
 
-def extractSignalMasts(signalMastsX, outputDir):
-    with open(outputDir + 'signalmasts.csv', 'w') as outFile:
-        tablewriter = csv.writer(outFile)
-        row = [ 'Columns', 'System name', 'User name', 'Comment', 'Unlit', 'Disabled aspects' ]
-        tablewriter.writerow(row)
+def extractSignalMasts(signalMastsX, output):
+    with output.rows('signalmasts.csv', 'signalmast') as tablewriter:
+        tablewriter.writerow(schema.signalMastSchemas['signalmast'].headings())
         row = [ 'class', signalMastsX.attrib['class']]
         tablewriter.writerow(row)
         for signalMastX in signalMastsX:
-            mastType = signalMastX.tag
-            systemName = ''
-            userName = ''
-            comment = ''
-            unlit='no'
-            disabledAspects = []
-            for child in signalMastX:
-                if child.tag == 'systemName':
-                    systemName = child.text
-                elif child.tag == 'userName':
-                    userName = child.text
-                elif child.tag == 'comment':
-                    comment = child.text
-                elif child.tag == 'unlit':
-                    unlit = child.attrib['allowed']
-                elif child.tag == 'disabledAspects':
-                    for c in child:
-                        disabledAspects.append(c.text)
-            da = '(' + ','.join(disabledAspects) + ')'
-            row = [ mastType, systemName, userName, comment, unlit, disabledAspects]
+            # All mast types have the same columns. The row kind is the mast type.
+            row = signalMastToRow(signalMastX)
+            row[0] = signalMastX.tag
             tablewriter.writerow(row)
+    addManifestEntry(output, 'signalmasts.csv', 'signalmast', signalMastsX, len(signalMastsX))
 
-def extractBlocks(blocksX, outputDir):
-    with open(outputDir + 'blocks.csv', 'w') as outFile:
-        tablewriter = csv.writer(outFile)
-        row = [ 'Columns', 'System name', 'User name', 'length', 'curve', 'comment', 'permissive', 'Occupancy sensor', 'Speed', 'Reporter system name', 'Reporter use current']
-        tablewriter.writerow(row)
+def extractBlocks(blocksX, output):
+    numRows = 0
+    with output.rows('blocks.csv', 'block') as tablewriter:
+        tablewriter.writerow(schema.blockSchema.headings())
         row = [ 'class', blocksX.attrib['class']]
         tablewriter.writerow(row)
         for child in blocksX:
@@ -314,36 +263,14 @@ def extractBlocks(blocksX, outputDir):
                 row = [ 'defaultspeed', child.text ]
                 tablewriter.writerow(row)
             elif child.tag == 'block':
-                blockX = child
-                # Block elements are present in duplicate to break circularity in the code
-                # Only the instance with the permissive child element needs to be considered
-                permissiveX = blockX.find('permissive')
-                if permissiveX != None:
-                    length = blockX.attrib['length']
-                    curve = blockX.attrib['curve']
-                    systemName = blockX.find('systemName').text
-                    userName = ''
-                    userNameX = blockX.find('userName')
-                    if userNameX != None:
-                        userName = userNameX.text
-                    comment = ''
-                    commentX = blockX.find('comment')
-                    if commentX != None:
-                        comment = commentX.text
-                    permissive = permissiveX.text
-                    occupancySensor = getOptionalElement(blockX, 'occupancysensor')
-                    speed = getOptionalElement(blockX, 'speed')
-                    reporterSystemName = ''
-                    reporterUseCurrent = ''
-                    reporterX = blockX.find('reporter')
-                    if reporterX != None:
-                        reporterSystemName = reporterX.attrib['systemName']
-                        reporterUseCurrent = reporterX.attrib['useCurrent']
-                    row = ['block', systemName, userName, length, curve, comment, permissive, occupancySensor, speed, reporterSystemName, reporterUseCurrent]
+                row = blockToRow(child)
+                if row is not None:
                     tablewriter.writerow(row)
+                    numRows += 1
+    addManifestEntry(output, 'blocks.csv', 'block', blocksX, numRows)
 
-def extractXMLblob(root, filename, outputDir):
-    with open(outputDir + filename, 'w') as outFile:
+def extractXMLblob(root, filename, output):
+    with output.open(filename) as outFile:
         t = ET.tostring(root, encoding='unicode')
         outFile.write(t)
 
@@ -352,28 +279,118 @@ def removeElements(root, tagName):
     for e in elements:
         root.remove(e)
 
+extractors = {
+    'sensors': extractSensors,
+    'turnouts': extractTurnouts,
+    'lights': extractLights,
+    'signalheads': extractSignalHeads,
+    'signalmasts': extractSignalMasts,
+    'blocks': extractBlocks,
+    'reporters': extractReporters,
+    }
+
+# Extract the managed sections of the layout and the manifest to output.
+# elements are the top level elements of the layout, from xmlbackend.iterElements.
+def extractLayout(elements, layoutFileName, output):
+    for child in elements:
+        extractor = extractors[child.tag]
+        with profiler.phase(extractor.__name__, child.attrib.get('class', '')) as p:
+            extractor(child, output)
+            p.count = len(child)
+    output.writeManifest(layoutFileName)
+
+# With --only or --jobs, the managed sections are located with layoutscan,
+# which skips over the rest of the layout without parsing it. Each section is
+# parsed from a small document made of the start of the layout up to the end of
+# the root start tag, which keeps the declarations, then the section and the
+# root end tag.
+
+# The documents of the sections whose tags are in tags, or None if the layout
+# cannot be scanned. data is the text of the layout, from layoutscan.layoutBytes.
+def sectionFragments(data, tags):
+    if not layoutscan.scannable(layoutscan.encodingOf(data)):
+        return None
+    rootTag, contentStart, elements = layoutscan.scanLayout(data)
+    head = data[:contentStart]
+    tail = b'</' + rootTag.encode() + b'>'
+    return [ head + data[start:end] + tail for (tag, start, end) in elements if tag in tags ]
+
+def parseFragment(fragment):
+    return xmlbackend.parse(io.BytesIO(fragment)).getroot()[0]
+
+# Runs in a worker process. Returns the manifest entries, and the files that
+# changed and the ones that did not, which the main process reports.
+def extractFragment(fragment, outputDir, backend):
+    xmlbackend.useBackend(backend)
+    sectionX = parseFragment(fragment)
+    output = DirectoryOutput(outputDir)
+    extractors[sectionX.tag](sectionX, output)
+    written = (list(outputfiles.changedFiles), list(outputfiles.unchangedFiles))
+    outputfiles.clearSummary()
+    return output.manifestEntries, written
+
+# Returns False, having done nothing, if the layout cannot be scanned
+def extractInParallel(layoutFile, tags, output, jobs):
+    with layoutscan.layoutBytes(layoutFile) as data:
+        fragments = sectionFragments(data, tags)
+    if fragments is None:
+        return False
+    n = len(fragments)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for (entries, (changed, unchanged)) in executor.map(extractFragment, fragments,
+                [output.outputDir] * n, [xmlbackend.backend] * n):
+            output.manifestEntries.extend(entries)
+            outputfiles.changedFiles.extend(changed)
+            outputfiles.unchangedFiles.extend(unchanged)
+    output.writeManifest(layoutFile)
+    return True
+
+# Extract the sections whose tags are in tags. When they are all of the managed
+# sections, the layout is parsed as it is extracted, and only the managed
+# sections are kept, one at a time. Otherwise the other sections are skipped
+# over without being parsed, if the layout can be scanned.
+def extractFile(layoutFile, tags, output):
+    if len(tags) < len(extractors):
+        with layoutscan.layoutBytes(layoutFile) as data:
+            fragments = sectionFragments(data, tags)
+        if fragments is not None:
+            extractLayout(map(parseFragment, fragments), layoutFile, output)
+            return
+    extractLayout(xmlbackend.iterElements(layoutFile, tags), layoutFile, output)
+
+# Library use. layoutFile is a file name or a binary file object. Returns the
+# CSV files and the manifest as a dictionary of file name to the text of the
+# file, as compile.compileTables takes them, without writing any files.
+def extractTables(layoutFile):
+    output = TableOutput()
+    layoutFileName = layoutFile if isinstance(layoutFile, str) else getattr(layoutFile, 'name', '')
+    extractLayout(xmlbackend.iterElements(layoutFile, extractors), layoutFileName, output)
+    return output.tables
+
 def main(args):
+    if args.xmlBackend:
+        xmlbackend.useBackend(args.xmlBackend)
+    profiling.enableIfRequested(profiler, args)
     ifn = args.inputFile
-    tree = ET.parse(ifn)
-    root = tree.getroot()
     outputDir = args.csvDir
     if not outputDir.endswith('/'):
         outputDir = outputDir + '/'
-    for child in root:
-        if child.tag == "sensors":
-            extractSensors(child, outputDir)
-        elif child.tag == 'turnouts':
-            extractTurnouts(child, outputDir)
-        elif child.tag == 'lights':
-            extractLights(child, outputDir)
-        elif child.tag == 'signalheads':
-            extractSignalHeads(child, outputDir)
-        elif child.tag == 'signalmasts':
-            extractSignalMasts(child, outputDir)
-        elif child.tag == 'blocks':
-            extractBlocks(child, outputDir)
-        elif child.tag == 'reporters':
-            extractReporters(child, outputDir)
+    # With --only, the files of the other sections are kept
+    tags = extractors if args.only is None else args.only
+    replacedTypes = None if args.only is None else sum([ manifest.sectionFileTypes[tag] for tag in args.only ], [])
+    if args.database:
+        with profiler.phase('parse', ifn), database.DatabaseOutput(args.database, replacedTypes) as output:
+            extractFile(ifn, tags, output)
+        profiler.report(args)
+        return
+    output = DirectoryOutput(outputDir, replacedTypes)
+    parallel = False
+    if args.jobs > 1:
+        with profiler.phase('extract in parallel', ifn):
+            parallel = extractInParallel(ifn, tags, output, args.jobs)
+    if not parallel:
+        with profiler.phase('parse', ifn):
+            extractFile(ifn, tags, output)
     # Finally, we create a reduced version of the layout config XML file with
     # the externally managed objects removed.
     # Commented this out as the reduced XML is no longer necessary (11/5/2022)
@@ -384,10 +401,29 @@ def main(args):
     #removeElements(root, 'signalmasts')
     #removeElements(root, 'blocks')
     #tree.write(outputDir + 'reduced.xml')
+    outputfiles.printSummary()
+    profiler.report(args)
+
+# The value of --only, a list of section tags separated by commas
+def sectionTags(value):
+    tags = [ tag.strip() for tag in value.split(',') if tag.strip() != '' ]
+    unknown = [ tag for tag in tags if tag not in extractors ]
+    if unknown or not tags:
+        raise argparse.ArgumentTypeError('expected sections from %s, got %s' % (','.join(extractors), value))
+    return tags
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Deconstruct a JMRI XML formatted layout description file')
     parser.add_argument('inputFile', type=str, help='JMRI layout description file in XML format')
     parser.add_argument('--csvDir', type=str, default='.', help='Directory in which to write the generated CSV files')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes that parse the sections and write the CSV files')
+    parser.add_argument('--only', type=sectionTags, default=None, metavar='SECTIONS',
+        help='Extract only these sections, as in turnouts,blocks, and keep the files of the others in the manifest')
+    parser.add_argument('--database', type=str, default=None,
+        help='SQLite database file to write the CSV files to as tables, instead of the CSV directory')
+    xmlbackend.addBackendArgument(parser)
+    profiling.addProfileArguments(parser)
     args = parser.parse_args()
+    if args.database and args.jobs > 1:
+        parser.error('--jobs cannot be used with --database')
     main(args)
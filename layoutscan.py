@@ -0,0 +1,137 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# A scanner over the bytes of a layout file that locates its top level elements
+# without parsing them. It is used by compile.py --splice, which copies the
+# elements that are not externally managed unchanged, and by extract.py --jobs,
+# which parses the managed ones in worker processes.
+
+import codecs
+import contextlib
+import mmap
+import re
+import compression
+
+xmlDeclarationPattern = re.compile(rb'(?:\xef\xbb\xbf)?<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)')
+startTagPattern = re.compile(rb'<([^\s/>!?]+)(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+# All markup, for the elements that contain comments, CDATA or processing instructions
+markupPattern = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|</[^>]*>|<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>', re.S)
+
+# Returns the encoding of the layout. The scanner only works with encodings in
+# which markup is written in ASCII, which excludes UTF-16.
+def encodingOf(data):
+    if startsWith(data, b'\xff\xfe', 0) or startsWith(data, b'\xfe\xff', 0):
+        return 'UTF-16'
+    declaration = xmlDeclarationPattern.match(data)
+    return declaration.group(1).decode() if declaration else 'UTF-8'
+
+def scannable(encoding):
+    return not codecs.lookup(encoding).name.startswith('utf-16')
+
+# mmap objects have no startswith
+def startsWith(data, prefix, i):
+    return data[i:i + len(prefix)] == prefix
+
+# Returns the offset following the markup at offset i that starts with opening
+def skipMarkup(data, i, opening, closing):
+    end = data.find(closing, i + len(opening))
+    if end < 0:
+        raise ValueError('Unterminated %s at offset %d' % (opening.decode(), i))
+    return end + len(closing)
+
+# Returns the offset following the end tag of the element whose content starts
+# at contentStart, by following all of the markup
+def scanElementEnd(data, contentStart):
+    depth = 1
+    for m in markupPattern.finditer(data, contentStart):
+        tag = m.group()
+        if tag.startswith(b'</'):
+            depth -= 1
+            if depth == 0:
+                return m.end()
+        elif not (tag.startswith(b'<!') or tag.startswith(b'<?') or tag.endswith(b'/>')):
+            depth += 1
+    raise ValueError('Unterminated element at offset %d' % contentStart)
+
+# Returns the offset following the end tag of the element named tag whose content
+# starts at contentStart. Only the tags with the same name need to be counted,
+# unless there is markup that could hide a tag.
+def findElementEnd(data, tag, contentStart):
+    endPattern = re.compile(rb'</' + re.escape(tag) + rb'\s*>')
+    nestedPattern = re.compile(rb'<' + re.escape(tag) + rb'[\s/>]')
+    depth = 1
+    i = contentStart
+    while True:
+        endMatch = endPattern.search(data, i)
+        if endMatch is None:
+            raise ValueError('No end tag for %s at offset %d' % (tag.decode(), contentStart))
+        end = endMatch.start()
+        if data.find(b'<!', i, end) >= 0 or data.find(b'<?', i, end) >= 0:
+            return scanElementEnd(data, contentStart)
+        for nested in nestedPattern.finditer(data, i, end):
+            if not startTagPattern.match(data, nested.start()).group().endswith(b'/>'):
+                depth += 1
+        depth -= 1
+        if depth == 0:
+            return endMatch.end()
+        i = endMatch.end()
+
+# Returns the tag of the root element, the offset of the end of its start tag,
+# and a list of (tag, start, end) for each of the top level elements of the layout
+def scanLayout(data):
+    i = 0
+    while True:
+        i = data.find(b'<', i)
+        if i < 0:
+            raise ValueError('No root element')
+        if startsWith(data, b'<?', i):
+            i = skipMarkup(data, i, b'<?', b'?>')
+        elif startsWith(data, b'<!--', i):
+            i = skipMarkup(data, i, b'<!--', b'-->')
+        elif startsWith(data, b'<!', i):
+            i = skipMarkup(data, i, b'<!', b'>') # The document type, without an internal subset
+        else:
+            break
+    rootTag = startTagPattern.match(data, i)
+    contentStart = rootTag.end()
+    elements = []
+    if rootTag.group().endswith(b'/>'):
+        return rootTag.group(1).decode(), contentStart, elements
+    i = contentStart
+    while True:
+        i = data.find(b'<', i)
+        if i < 0:
+            raise ValueError('No end tag for the root element')
+        if startsWith(data, b'</', i):
+            break
+        elif startsWith(data, b'<!--', i):
+            i = skipMarkup(data, i, b'<!--', b'-->')
+        elif startsWith(data, b'<![CDATA[', i):
+            i = skipMarkup(data, i, b'<![CDATA[', b']]>')
+        elif startsWith(data, b'<?', i):
+            i = skipMarkup(data, i, b'<?', b'?>')
+        else:
+            startTag = startTagPattern.match(data, i)
+            if startTag is None:
+                raise ValueError('Malformed tag at offset %d' % i)
+            tag = startTag.group(1)
+            if startTag.group().endswith(b'/>'):
+                end = startTag.end()
+            else:
+                end = findElementEnd(data, tag, startTag.end())
+            elements.append((tag.decode(), i, end))
+            i = end
+    return rootTag.group(1).decode(), contentStart, elements
+
+# The contents of the layout file. An uncompressed file is memory mapped, and
+# a compressed one is decompressed into memory.
+@contextlib.contextmanager
+def layoutBytes(layoutFile):
+    if compression.compressionOf(layoutFile) is not None:
+        with compression.openInput(layoutFile, 'rb') as inputFile:
+            yield inputFile.read()
+        return
+    with open(layoutFile, 'rb') as inputFile, mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield data
@@ -0,0 +1,163 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# extract.py writes a manifest of the CSV files that it generates, and compile.py
+# loads the files listed in it. The manifest is a JSON file in the CSV directory:
+#
+#   { "layoutFile": "layout.xml",
+#     "files": [ { "file": "sensor_cmri_serial_CS.csv", "type": "sensor",
+#                  "class": "jmri.jmrix.cmri.serial.configurexml.SerialSensorManagerXml",
+#                  "rows": 52, "sha256": "..." }, ... ] }
+#
+# A CSV file added by hand must also be added to the manifest, or the manifest
+# removed, in which case the CSV files are found by their names. A CSV file may
+# be replaced by a compressed copy, as in sensor_cmri_serial_CS.csv.gz.
+
+import contextlib
+import csv
+import io
+import json
+import os
+from pathlib import Path
+import compression
+
+manifestFileName = 'manifest.json'
+
+# The types of the files, and the prefixes of their names
+fileTypes = [
+    ('sensor', 'sensor_'),
+    ('turnout', 'turnout_'),
+    ('light', 'light_'),
+    ('reporter', 'reporter_'),
+    ('tripleTurnoutSignalHead', 'signalheads_tripleturnout'),
+    ('singleTurnoutSignalHead', 'signalheads_singleturnout'),
+    ('signalmast', 'signalmasts'),
+    ('block', 'blocks'),
+    ]
+
+# The types of the files written for each managed section of the layout
+sectionFileTypes = {
+    'sensors': [ 'sensor' ],
+    'turnouts': [ 'turnout' ],
+    'lights': [ 'light' ],
+    'reporters': [ 'reporter' ],
+    'signalheads': [ 'tripleTurnoutSignalHead', 'singleTurnoutSignalHead' ],
+    'signalmasts': [ 'signalmast' ],
+    'blocks': [ 'block' ],
+    }
+
+# The files whose names do not depend on the layout. Without a manifest these
+# are loaded even when missing, so that the omission is reported.
+fixedFileNames = {
+    'tripleTurnoutSignalHead': 'signalheads_tripleturnout.csv',
+    'singleTurnoutSignalHead': 'signalheads_singleturnout.csv',
+    'signalmast': 'signalmasts.csv',
+    'block': 'blocks.csv',
+    }
+
+sourceSuffixes = ('.csv', '.csv.gz', '.csv.xz')
+
+# Whether a change to this file in the CSV directory changes the compiled layout
+def isSourceFileName(fileName):
+    return fileName == manifestFileName or fileName.endswith(sourceSuffixes)
+
+# The file, or a compressed copy of it if only that exists
+def existingFileName(inputDir, fileName):
+    for suffix in ('', '.gz', '.xz'):
+        if os.path.exists(inputDir + fileName + suffix):
+            return inputDir + fileName + suffix
+    return inputDir + fileName
+
+def emptySourceFiles():
+    return { fileType: [] for (fileType, prefix) in fileTypes }
+
+# The file names listed in the entries of a manifest
+def listedSourceFiles(entries):
+    sourceFiles = emptySourceFiles()
+    for entry in entries:
+        if entry['type'] in sourceFiles:
+            sourceFiles[entry['type']].append(entry['file'])
+    return sourceFiles
+
+# The file names that are not fixed, found from their prefixes. A file and a
+# compressed copy of it are loaded once, preferring the file as existingFileName
+# does.
+def namedSourceFiles(fileNames):
+    sourceFiles = emptySourceFiles()
+    names = set(fileNames)
+    for fileName in fileNames:
+        if not fileName.endswith(sourceSuffixes):
+            continue
+        baseName = fileName[:fileName.rindex('.csv') + len('.csv')]
+        if [ baseName + suffix for suffix in ('', '.gz', '.xz') if baseName + suffix in names ][0] != fileName:
+            continue
+        for (fileType, prefix) in fileTypes:
+            if fileType not in fixedFileNames and fileName.startswith(prefix):
+                sourceFiles[fileType].append(fileName)
+    return sourceFiles
+
+def readManifest(inputDir):
+    with open(inputDir + manifestFileName, 'r') as inputFile:
+        entries = json.load(inputFile)['files']
+    return { fileType: [ existingFileName(inputDir, fileName) for fileName in fileNames ]
+        for (fileType, fileNames) in listedSourceFiles(entries).items() }
+
+def globSourceFiles(inputDir):
+    fileNames = namedSourceFiles([ path.name for path in Path(inputDir).iterdir() ])
+    sourceFiles = { fileType: [ str(Path(inputDir) / fileName) for fileName in fileNames[fileType] ]
+        for fileType in fileNames }
+    for (fileType, fileName) in fixedFileNames.items():
+        sourceFiles[fileType].append(existingFileName(inputDir, fileName))
+    return sourceFiles
+
+# When only some of the sections are extracted, the manifest is updated rather
+# than replaced. The entries of fileTypes take the place of the previous entries
+# of those types, where the first of them was. The other previous entries are
+# kept, in order.
+def mergeEntries(previousEntries, entries, fileTypes):
+    merged = []
+    placedTypes = set()
+    for entry in previousEntries:
+        if entry['type'] not in fileTypes:
+            merged.append(entry)
+        elif entry['type'] not in placedTypes:
+            merged += [ e for e in entries if e['type'] == entry['type'] ]
+            placedTypes.add(entry['type'])
+    return merged + [ e for e in entries if e['type'] not in placedTypes ]
+
+# Returns the CSV files to load, as a list of file names for each file type
+def sourceFiles(inputDir):
+    if os.path.exists(inputDir + manifestFileName):
+        return readManifest(inputDir)
+    return globSourceFiles(inputDir)
+
+# The same for tables, a dictionary of file name to the text of the file, which
+# takes the place of the CSV directory when extract and compile are used as a
+# library. The file names are the keys of tables. tables may also be a
+# database.Database, which lists its files itself.
+def tableSourceFiles(tables):
+    if not isinstance(tables, dict):
+        return tables.sourceFiles()
+    if manifestFileName in tables:
+        return listedSourceFiles(json.loads(tables[manifestFileName])['files'])
+    sourceFiles = namedSourceFiles(tables)
+    for (fileType, fileName) in fixedFileNames.items():
+        sourceFiles[fileType].append(fileName)
+    return sourceFiles
+
+# Open a source file for reading. Returns a context manager for a CSV reader
+# over its rows, or over the rows of the table of that name if tables is given.
+@contextlib.contextmanager
+def openRows(fileName, tables=None):
+    if tables is None:
+        inputFile = compression.openInput(fileName, 'r')
+    elif isinstance(tables, dict):
+        inputFile = io.StringIO(tables[fileName], newline=None)
+    else:
+        with tables.openRows(fileName) as reader:
+            yield reader
+        return
+    with inputFile:
+        yield csv.reader(inputFile)
@@ -0,0 +1,116 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Output files are written to a temporary file next to the target, which then
+# replaces the target only if the contents are different. Unchanged files keep
+# their modification times, and a failed run leaves the old file in place.
+#
+#   with OutputFile(fileName, 'w') as outFile:
+#       outFile.write(...)
+#
+# A file name ending in .gz or .xz is compressed. The gzip header carries no
+# time or name, so that an unchanged layout compresses to the same bytes. The
+# file name - is standard output, which is written directly.
+
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import shutil
+import sys
+import threading
+
+standardOutput = '-'
+
+# The files written since the summary was last printed
+changedFiles = []
+unchangedFiles = []
+
+def fileHash(fileName):
+    h = hashlib.sha256()
+    with open(fileName, 'rb') as inputFile:
+        for block in iter(lambda: inputFile.read(1 << 20), b''):
+            h.update(block)
+    return h.digest()
+
+def sameContents(fileName, otherFileName):
+    if not os.path.exists(otherFileName):
+        return False
+    if os.path.getsize(fileName) != os.path.getsize(otherFileName):
+        return False
+    return fileHash(fileName) == fileHash(otherFileName)
+
+# The arguments are those of open. After the with block, changed is whether
+# the target was replaced.
+class OutputFile:
+    def __init__(self, fileName, mode='w', **kwargs):
+        self.fileName = fileName
+        # Unique to the thread, as compile.py --serve may write a file from several at once
+        self.tempFileName = '%s.%d.%d.tmp' % (fileName, os.getpid(), threading.get_ident())
+        self.mode = mode
+        self.kwargs = kwargs
+        self.changed = None
+
+    def __enter__(self):
+        # The layers are the file, a compressor and a text encoder, each optional
+        # except the file. Closing the compressor does not close the file under it.
+        if self.fileName == standardOutput:
+            self.rawFile = None
+            binaryFile = sys.__stdout__.buffer
+        else:
+            self.rawFile = binaryFile = open(self.tempFileName, 'wb')
+        self.compressedFile = None
+        if self.fileName.endswith('.gz'):
+            self.compressedFile = binaryFile = gzip.GzipFile(filename='', mode='wb', fileobj=binaryFile, mtime=0)
+        elif self.fileName.endswith('.xz'):
+            self.compressedFile = binaryFile = lzma.LZMAFile(binaryFile, 'wb')
+        if 'b' in self.mode:
+            self.textFile = None
+            self.file = binaryFile
+        else:
+            self.textFile = self.file = io.TextIOWrapper(binaryFile, **self.kwargs)
+        return self.file
+
+    def close(self):
+        if self.textFile is not None:
+            self.textFile.flush()
+            self.textFile.detach()
+        if self.compressedFile is not None:
+            self.compressedFile.close()
+        if self.rawFile is not None:
+            self.rawFile.close()
+        else:
+            sys.__stdout__.buffer.flush()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        if self.rawFile is None:
+            return False
+        if excType is not None:
+            os.remove(self.tempFileName)
+            return False
+        self.changed = not sameContents(self.tempFileName, self.fileName)
+        if self.changed:
+            if os.path.exists(self.fileName):
+                shutil.copymode(self.fileName, self.tempFileName)
+            os.replace(self.tempFileName, self.fileName)
+            changedFiles.append(self.fileName)
+        else:
+            os.remove(self.tempFileName)
+            unchangedFiles.append(self.fileName)
+        return False
+
+def printSummary():
+    total = len(changedFiles) + len(unchangedFiles)
+    if changedFiles:
+        print('%d of %d files changed: %s' % (len(changedFiles), total, ', '.join(changedFiles)))
+    elif total > 0:
+        print('No changes to the %d files written' % total)
+    clearSummary()
+
+def clearSummary():
+    del changedFiles[:]
+    del unchangedFiles[:]
@@ -0,0 +1,124 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Timing and memory use of the phases of compile, extract and test, for the
+# --profile option. Each script has a module level profiler, which does nothing
+# until it is enabled. A phase is a with block:
+#
+#   with profiler.phase('parse', fileName) as p:
+#       ...
+#       p.count = numElements
+#
+# Phases may be nested. The peak memory of a phase is the most memory allocated
+# by Python during the phase beyond what was allocated when it started, as
+# measured by tracemalloc, which makes the script slower while it is enabled.
+
+import json
+import sys
+import time
+import tracemalloc
+
+class Phase:
+    def __init__(self, profiler, name, item, depth):
+        self.profiler = profiler
+        self.name = name
+        self.item = item
+        self.depth = depth
+        self.count = None # Set by the phase to the number of rows or elements handled
+        self.seconds = 0.0
+        self.peakBytes = 0
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        return self
+
+    def __exit__(self, *excInfo):
+        self.profiler.exit(self)
+        return False
+
+class NoPhase:
+    count = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        return False
+
+noPhase = NoPhase()
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.phases = [] # In the order they started
+        self.stack = []
+        self.peakBytes = 0 # The peak over all phases, as the peak is reset for each phase
+
+    def enable(self):
+        self.enabled = True
+        self.startTime = time.perf_counter()
+        tracemalloc.start()
+
+    def phase(self, name, item=''):
+        if not self.enabled:
+            return noPhase
+        return Phase(self, name, item, len(self.stack))
+
+    def enter(self, phase):
+        # The peak is reset for the new phase, so the peak so far is passed up first
+        current, peak = tracemalloc.get_traced_memory()
+        self.peakBytes = max(self.peakBytes, peak)
+        if self.stack:
+            self.stack[-1].peakSoFar = max(self.stack[-1].peakSoFar, peak)
+        tracemalloc.reset_peak()
+        phase.startBytes = current
+        phase.peakSoFar = current
+        self.phases.append(phase)
+        self.stack.append(phase)
+        phase.startTime = time.perf_counter()
+
+    def exit(self, phase):
+        phase.seconds = time.perf_counter() - phase.startTime
+        peak = max(phase.peakSoFar, tracemalloc.get_traced_memory()[1])
+        phase.peakBytes = peak - phase.startBytes
+        self.peakBytes = max(self.peakBytes, peak)
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1].peakSoFar = max(self.stack[-1].peakSoFar, peak)
+
+    def summary(self):
+        return {
+            'command': ' '.join(sys.argv),
+            'seconds': time.perf_counter() - self.startTime,
+            'peakBytes': max(self.peakBytes, tracemalloc.get_traced_memory()[1]),
+            'phases': [ { 'name': p.name, 'item': p.item, 'depth': p.depth, 'seconds': p.seconds,
+                'count': p.count, 'peakBytes': p.peakBytes } for p in self.phases ],
+            }
+
+    # Print the phases as a table, or write them as JSON to --profileFile
+    def report(self, args):
+        if not self.enabled:
+            return
+        summary = self.summary()
+        if args.profileFile:
+            with open(args.profileFile, 'w') as outFile:
+                json.dump(summary, outFile, indent=2)
+            return
+        print('%-40s %-50s %9s %9s %10s' % ('Phase', 'Item', 'Time (s)', 'Count', 'Peak (MB)'))
+        for p in summary['phases']:
+            count = '' if p['count'] is None else str(p['count'])
+            print('%-40s %-50s %9.3f %9s %10.1f' % ('  ' * p['depth'] + p['name'], p['item'],
+                p['seconds'], count, p['peakBytes'] / 1e6))
+        print('%-40s %-50s %9.3f %9s %10.1f' % ('Total', '', summary['seconds'], '', summary['peakBytes'] / 1e6))
+
+def addProfileArguments(parser):
+    parser.add_argument('--profile', action='store_true',
+        help='Print the time and peak memory of each phase. Tracing the memory makes the run several times slower.')
+    parser.add_argument('--profileFile', type=str, default=None,
+        help='Write the time and peak memory of each phase to this file as JSON. Implies --profile.')
+
+def enableIfRequested(profiler, args):
+    if args.profile or args.profileFile:
+        profiler.enable()
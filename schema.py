@@ -0,0 +1,394 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# The layout of the CSV files for each type of externally managed object.
+# Every object is one CSV row: the row kind followed by one value per column.
+# extract.py and compile.py generate their converters between rows and XML
+# elements from these schemas when they are imported, so adding a column is
+# a change to this file only.
+
+import xml.etree.ElementTree as ET
+import re
+from functools import lru_cache
+
+# The ways in which a column can be stored in the XML element of an object
+
+# An attribute of the object element
+class Attribute:
+    def __init__(self, name, optional=False, default=''):
+        self.name = name
+        self.optional = optional # Left out of the XML when empty
+        self.default = default # Written to the CSV when missing from the XML
+
+# The text of a child element
+class Child:
+    def __init__(self, tag, optional=True):
+        self.tag = tag
+        self.optional = optional
+
+# The text of a child element that is identified by its defines attribute
+class DefinedChild:
+    def __init__(self, tag, defines):
+        self.tag = tag
+        self.defines = defines
+
+# An attribute of a child element. Several columns may share the child element,
+# which is left out when any of its key columns is empty.
+class ChildAttribute:
+    def __init__(self, tag, name, key=False, default=''):
+        self.tag = tag
+        self.name = name
+        self.key = key
+        self.default = default
+
+# A list of values, stored as the text of the children of a child element
+class ChildList:
+    def __init__(self, tag, itemTag, parse, format):
+        self.tag = tag
+        self.itemTag = itemTag
+        self.parse = parse # CSV value to a sequence of values
+        self.format = format # list to CSV value
+
+# A column may be stored in more than one place. The first is the one that
+# is read when extracting. references is the type of the object named by the
+# column, if any, which is checked when compiling.
+class Column:
+    def __init__(self, name, heading, *fields, references=None):
+        self.name = name
+        self.heading = heading
+        self.fields = fields
+        self.references = references
+
+# childOrder lists the tags of the child elements, when they are not in the
+# order of the columns. computedChildren maps a tag in childOrder to a column
+# name and a function that makes the child element from the column value, or
+# returns None.
+class ObjectSchema:
+    def __init__(self, rowKind, tag, columns, fixedAttributes=None, childOrder=None, computedChildren=None):
+        self.rowKind = rowKind
+        self.tag = tag
+        self.columns = columns
+        self.fixedAttributes = fixedAttributes or {}
+        self.childOrder = childOrder
+        self.computedChildren = computedChildren or {}
+
+    def headings(self):
+        return [ 'Columns' ] + [ c.heading for c in self.columns ]
+
+    def columnNames(self):
+        return [ c.name for c in self.columns ]
+
+    def columnIndex(self, name):
+        return self.columnNames().index(name)
+
+# Disabled aspects are stored as the Python representation of a list of
+# strings, as in ['Clear', 'Approach'], or of a tuple of them. A list of
+# unquoted names separated by commas, optionally in parentheses, is also
+# accepted, as in (Clear,Approach).
+# Masts of the same family usually share a list, so parsed lists are cached.
+quotedStringPattern = re.compile(r"'((?:[^'\\]|\\.)*)'" + r'|"((?:[^"\\]|\\.)*)"')
+listSeparatorPattern = re.compile(r'\s*,?\s*')
+escapePattern = re.compile(r'\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)')
+simpleEscapes = { 'n': '\n', 't': '\t', 'r': '\r', '\\': '\\', "'": "'", '"': '"' }
+
+def unescape(match):
+    escape = match.group(1)
+    if escape[0] in 'xuU' and len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    if escape in simpleEscapes:
+        return simpleEscapes[escape]
+    raise ValueError('Unsupported escape \\' + escape)
+
+def parseQuotedList(value):
+    aspects = []
+    position = 1
+    end = len(value) - 1
+    while True:
+        separator = listSeparatorPattern.match(value, position)
+        position = separator.end()
+        if position >= end:
+            break
+        if aspects and ',' not in separator.group():
+            raise ValueError('Missing comma in disabled aspects ' + value)
+        match = quotedStringPattern.match(value, position)
+        if match is None:
+            raise ValueError('Cannot parse disabled aspects ' + value)
+        text = match.group(1) if match.group(1) is not None else match.group(2)
+        if '\\' in text:
+            text = escapePattern.sub(unescape, text)
+        aspects.append(text)
+        position = match.end()
+    return aspects
+
+# Returns a tuple of the aspect names. A value that starts as a list literal
+# must be a complete one, and the names in the plain form cannot be quoted.
+@lru_cache(maxsize=1024)
+def parseAspectList(value):
+    value = value.strip()
+    if value == '':
+        return ()
+    if value[0] in '[(' and value[-1] != { '[': ']', '(': ')' }[value[0]]:
+        raise ValueError('Unterminated disabled aspects ' + value)
+    if value[0] == '[' or (value[0] == '(' and ('"' in value or "'" in value)):
+        return tuple(parseQuotedList(value))
+    if value[0] == '(':
+        value = value[1:-1]
+    if '"' in value or "'" in value:
+        raise ValueError('Cannot parse disabled aspects ' + value)
+    return tuple([ a.strip() for a in value.split(',') if a.strip() != '' ])
+
+def formatAspectList(aspects):
+    return str(aspects)
+
+# Special addition for Loconet turnouts: disable sending OFF message
+def loconetTurnoutProperties(systemName):
+    if not systemName.startswith('L'):
+        return None
+    propertiesX = ET.Element('properties')
+    propertyX = ET.SubElement(propertiesX, 'property')
+    ET.SubElement(propertyX, 'key').text = 'Send ON/OFF'
+    valueX = ET.SubElement(propertyX, 'value')
+    valueX.attrib['class'] = 'java.lang.Boolean'
+    valueX.text = 'false'
+    return propertiesX
+
+sensorSchema = ObjectSchema('sensor', 'sensor', [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('inverted', 'Inverted', Attribute('inverted', default='false')),
+    Column('comment', 'Comment', Child('comment')),
+    Column('useGlobalDebounceTimer', 'Use global debounce timer', Child('useGlobalDebounceTimer')),
+    ])
+
+turnoutSchema = ObjectSchema('turnout', 'turnout', [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('comment', 'Comment', Child('comment')),
+    Column('feedback', 'Feedback', Attribute('feedback')),
+    Column('sensor1', 'Sensor 1', Attribute('sensor1', optional=True), references='sensor'),
+    Column('sensor2', 'Sensor 2', Attribute('sensor2', optional=True), references='sensor'),
+    Column('inverted', 'Inverted', Attribute('inverted')),
+    Column('controlType', 'Control type', Attribute('controlType', optional=True)),
+    Column('automate', 'Automate', Attribute('automate')),
+    Column('divergingSpeed', 'Reverse speed', Child('divergingSpeed')),
+    Column('straightSpeed', 'Normal speed', Child('straightSpeed')),
+    ],
+    childOrder=[ 'systemName', 'userName', 'comment', 'properties', 'divergingSpeed', 'straightSpeed' ],
+    computedChildren={ 'properties': ('systemName', loconetTurnoutProperties) })
+
+lightSchema = ObjectSchema('light', 'light', [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('comment', 'Comment', Child('comment')),
+    Column('minIntensity', 'Min intensity', Attribute('minIntensity')),
+    Column('maxIntensity', 'Max intensity', Attribute('maxIntensity')),
+    Column('transitionTime', 'Transition time', Attribute('transitionTime')),
+    Column('controlType', 'Control type', ChildAttribute('lightcontrol', 'controlType', key=True)),
+    Column('controlSensor', 'Control sensor', ChildAttribute('lightcontrol', 'controlSensor', key=True), references='sensor'),
+    Column('sensorSense', 'Sensor sense', ChildAttribute('lightcontrol', 'sensorSense', key=True)),
+    ])
+
+reporterSchema = ObjectSchema('reporter', 'reporter', [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('comment', 'Comment', Child('comment')),
+    ])
+
+tripleTurnoutSignalHeadClass = 'jmri.implementation.configurexml.TripleTurnoutSignalHeadXml'
+singleTurnoutSignalHeadClass = 'jmri.implementation.configurexml.SingleTurnoutSignalHeadXml'
+
+tripleTurnoutSignalHeadSchema = ObjectSchema('signalhead', 'signalhead', [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('comment', 'Comment', Child('comment')),
+    Column('green', 'Green', DefinedChild('turnoutname', 'green'), references='turnout'),
+    Column('yellow', 'Yellow', DefinedChild('turnoutname', 'yellow'), references='turnout'),
+    Column('red', 'Red', DefinedChild('turnoutname', 'red'), references='turnout'),
+    ],
+    fixedAttributes={ 'class': tripleTurnoutSignalHeadClass })
+
+singleTurnoutSignalHeadSchema = ObjectSchema('signalhead', 'signalhead', [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('comment', 'Comment', Child('comment')),
+    Column('thrown', 'Thrown', DefinedChild('appearance', 'thrown')),
+    Column('closed', 'Closed', DefinedChild('appearance', 'closed')),
+    Column('aspect', 'Aspect', DefinedChild('turnoutname', 'aspect'), references='turnout'),
+    ],
+    fixedAttributes={ 'class': singleTurnoutSignalHeadClass })
+
+signalMastColumns = [
+    Column('systemName', 'System name', Child('systemName', optional=False)),
+    Column('userName', 'User name', Child('userName')),
+    Column('comment', 'Comment', Child('comment')),
+    Column('unlit', 'Unlit', ChildAttribute('unlit', 'allowed', default='no')),
+    Column('disabledAspects', 'Disabled aspects',
+        ChildList('disabledAspects', 'disabledAspect', parseAspectList, formatAspectList)),
+    ]
+
+# The signal mast schemas, by row kind. The row kind is the element tag.
+signalMastSchemas = {
+    'signalmast': ObjectSchema('signalmast', 'signalmast', signalMastColumns,
+        fixedAttributes={ 'class': 'jmri.implementation.configurexml.SignalHeadSignalMastXml' }),
+    'virtualsignalmast': ObjectSchema('virtualsignalmast', 'virtualsignalmast', signalMastColumns,
+        fixedAttributes={ 'class': 'jmri.implementation.configurexml.VirtualSignalMastXml' }),
+    'mqttsignalmast': ObjectSchema('mqttsignalmast', 'mqttsignalmast', signalMastColumns,
+        fixedAttributes={ 'class': 'jmri.jmrix.mqtt.configurexml.MqttSignalMastXml' }),
+    }
+
+# This is the full block. compile.py also writes a forward reference to each block.
+blockSchema = ObjectSchema('block', 'block', [
+    Column('systemName', 'System name', Child('systemName', optional=False), Attribute('systemName')),
+    Column('userName', 'User name', Child('userName')),
+    Column('length', 'length', Attribute('length', optional=True)),
+    Column('curve', 'curve', Attribute('curve', optional=True)),
+    Column('comment', 'comment', Child('comment')),
+    Column('permissive', 'permissive', Child('permissive')),
+    Column('occupancySensor', 'Occupancy sensor', Child('occupancysensor'), references='sensor'),
+    Column('speed', 'Speed', Child('speed')),
+    Column('reporterSystemName', 'Reporter system name', ChildAttribute('reporter', 'systemName', key=True), references='reporter'),
+    Column('reporterUseCurrent', 'Reporter use current', ChildAttribute('reporter', 'useCurrent')),
+    ],
+    childOrder=[ 'systemName', 'userName', 'comment', 'speed', 'permissive', 'occupancysensor', 'reporter' ])
+
+# Code generation. The converters are generated as Python source so that the
+# per row work is a straight line of assignments, without looking at the schema.
+
+def compileFunction(name, lines, namespace):
+    source = '\n'.join(lines) + '\n'
+    exec(compile(source, '<schema %s>' % name, 'exec'), namespace)
+    function = namespace[name]
+    function.source = source
+    return function
+
+# The child elements made from the columns, in the order they are written.
+# Each is a (key, fields) pair, where fields are (column index, field) pairs.
+def childSlots(objectSchema):
+    slots = {}
+    for (i, column) in enumerate(objectSchema.columns):
+        for field in column.fields:
+            if isinstance(field, Attribute):
+                continue
+            key = field.tag
+            if isinstance(field, DefinedChild):
+                key = (field.tag, field.defines)
+            slots.setdefault(key, []).append((i, field))
+    for tag in objectSchema.computedChildren:
+        slots[tag] = None
+    keys = list(slots)
+    if objectSchema.childOrder is not None:
+        keys.sort(key=objectSchema.childOrder.index)
+    return [ (key, slots[key]) for key in keys ]
+
+# Returns a function that makes the XML element of an object from a CSV row.
+# offset is the index of the first column in the row, 0 when the row kind has
+# already been removed.
+def rowToElementFunction(objectSchema, offset=1):
+    name = objectSchema.rowKind + 'FromRow'
+    namespace = { 'Element': ET.Element, 'SubElement': ET.SubElement }
+    lines = [ 'def %s(row):' % name ]
+    if objectSchema.fixedAttributes:
+        namespace['fixedAttributes'] = objectSchema.fixedAttributes
+        lines.append('    x = Element(%r, fixedAttributes)' % objectSchema.tag)
+    else:
+        lines.append('    x = Element(%r)' % objectSchema.tag)
+    lines.append('    a = x.attrib')
+    for (i, column) in enumerate(objectSchema.columns):
+        for field in column.fields:
+            if isinstance(field, Attribute):
+                if field.optional:
+                    lines.append('    v = row[%d]' % (i + offset))
+                    lines.append('    if v != \'\':')
+                    lines.append('        a[%r] = v' % field.name)
+                else:
+                    lines.append('    a[%r] = row[%d]' % (field.name, i + offset))
+    for (key, fields) in childSlots(objectSchema):
+        if fields is None:
+            columnName, function = objectSchema.computedChildren[key]
+            namespace['compute_' + key] = function
+            lines.append('    c = compute_%s(row[%d])' % (key, objectSchema.columnIndex(columnName) + offset))
+            lines.append('    if c is not None:')
+            lines.append('        x.append(c)')
+            continue
+        i, field = fields[0]
+        if isinstance(field, Child):
+            if field.optional:
+                lines.append('    v = row[%d]' % (i + offset))
+                lines.append('    if v != \'\':')
+                lines.append('        SubElement(x, %r).text = v' % field.tag)
+            else:
+                lines.append('    SubElement(x, %r).text = row[%d]' % (field.tag, i + offset))
+        elif isinstance(field, DefinedChild):
+            lines.append('    v = row[%d]' % (i + offset))
+            lines.append('    if v != \'\':')
+            lines.append('        SubElement(x, %r, defines=%r).text = v' % (field.tag, field.defines))
+        elif isinstance(field, ChildAttribute):
+            keys = [ 'row[%d] != \'\'' % (j + offset) for (j, f) in fields if f.key ]
+            indent = '    '
+            if keys:
+                lines.append('    if %s:' % ' and '.join(keys))
+                indent = '        '
+            lines.append(indent + 'c = SubElement(x, %r)' % field.tag)
+            for (j, f) in fields:
+                lines.append(indent + 'c.attrib[%r] = row[%d]' % (f.name, j + offset))
+        elif isinstance(field, ChildList):
+            namespace['parse_' + field.tag] = field.parse
+            lines.append('    items = parse_%s(row[%d])' % (field.tag, i + offset))
+            lines.append('    if len(items) > 0:')
+            lines.append('        c = SubElement(x, %r)' % field.tag)
+            lines.append('        for item in items:')
+            lines.append('            SubElement(c, %r).text = item' % field.itemTag)
+    lines.append('    return x')
+    return compileFunction(name, lines, namespace)
+
+# Returns a function that makes the CSV row of an object from its XML element.
+# Each child element is looked at once, and handled by the branch for its tag.
+# If requiredTag is given, the function returns None for an element without a
+# child with that tag.
+def elementToRowFunction(objectSchema, requiredTag=None):
+    name = objectSchema.rowKind + 'ToRow'
+    namespace = {}
+    lines = [ 'def %s(x):' % name ]
+    values = []
+    branches = {} # Tag to the lines that handle a child with that tag
+    if requiredTag is not None:
+        lines.append('    found = False')
+        branches[requiredTag] = [ '        found = True' ]
+    for (i, column) in enumerate(objectSchema.columns):
+        field = column.fields[0]
+        v = 'v%d' % i
+        if isinstance(field, Attribute):
+            values.append('a.get(%r, %r)' % (field.name, field.default))
+            continue
+        values.append(v)
+        if isinstance(field, Child):
+            lines.append('    %s = \'\'' % v)
+            branches.setdefault(field.tag, []).append('        %s = c.text or \'\'' % v)
+        elif isinstance(field, DefinedChild):
+            lines.append('    %s = \'\'' % v)
+            branches.setdefault(field.tag, []).append(
+                '        if c.get(\'defines\') == %r:\n            %s = c.text or \'\'' % (field.defines, v))
+        elif isinstance(field, ChildAttribute):
+            lines.append('    %s = %r' % (v, field.default))
+            branches.setdefault(field.tag, []).append('        %s = c.get(%r, %r)' % (v, field.name, field.default))
+        elif isinstance(field, ChildList):
+            namespace['format_' + field.tag] = field.format
+            lines.append('    %s = format_%s([])' % (v, field.tag))
+            branches.setdefault(field.tag, []).append(
+                '        %s = format_%s([ i.text for i in c ])' % (v, field.tag))
+    if branches:
+        lines.append('    for c in x:')
+        lines.append('        t = c.tag')
+        keyword = 'if'
+        for (tag, branch) in branches.items():
+            lines.append('        %s t == %r:' % (keyword, tag))
+            lines.extend([ '    ' + line.replace('\n', '\n    ') for line in branch ])
+            keyword = 'elif'
+    if requiredTag is not None:
+        lines.append('    if not found:')
+        lines.append('        return None')
+    lines.append('    a = x.attrib')
+    lines.append('    return [ %r, %s ]' % (objectSchema.rowKind, ', '.join(values)))
+    return compileFunction(name, lines, namespace)
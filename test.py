@@ -5,8 +5,12 @@
 
 # Compare the original layout.xml with result of round trip through extract and compile
 
-import xml.etree.ElementTree as ET
 import argparse
+import profiling
+import schema
+import xmlbackend
+
+profiler = profiling.Profiler()
 
 def attributeMatches(original, updated, attributeName):
     if attributeName in original.attrib:
@@ -45,53 +49,45 @@ def optionalTagMatchesByPattern(original, updated, pattern):
         return originalChild.text == updatedChild.text
     return len(t) == 0 and len(u) == 0
 
-def getSensorBySystemName(root, systemName):
-    queryString = ".sensors/sensor/systemName[.='%s']/.." % systemName
-    sensors = root.findall(queryString)
-    if len(sensors) != 1:
-        return None
-    else:
-        return sensors[0]
-
-def getTurnoutBySystemName(root, systemName):
-    queryString = ".turnouts/turnout/systemName[.='%s']/.." % systemName
-    turnouts = root.findall(queryString)
-    if len(turnouts) != 1:
-        return None
-    else:
-        return turnouts[0]
-
-def getLightBySystemName(root, systemName):
-    queryString = ".lights/light/systemName[.='%s']/.." % systemName
-    lights = root.findall(queryString)
-    if len(lights) != 1:
-        return None
-    else:
-        return lights[0]
-
-def getSignalheadBySystemName(root, systemName):
-    queryString = ".signalheads/signalhead/systemName[.='%s']/.." % systemName
-    signalheads = root.findall(queryString)
-    if len(signalheads) != 1:
-        return None
-    else:
-        return signalheads[0]
+# Compare every column of an object defined by its schema, except the system
+# name by which the objects were matched up
+def columnsMatch(original, updated, objectSchema):
+    for column in objectSchema.columns[1:]:
+        for field in column.fields:
+            if isinstance(field, schema.Attribute):
+                if not attributeMatches(original, updated, field.name):
+                    return False
+            elif isinstance(field, schema.Child):
+                if not optionalTagMatches(original, updated, field.tag):
+                    return False
+            elif isinstance(field, schema.DefinedChild):
+                pattern = "./%s[@defines='%s']" % (field.tag, field.defines)
+                if not optionalTagMatchesByPattern(original, updated, pattern):
+                    return False
+            elif isinstance(field, schema.ChildAttribute):
+                originalChild = original.find(field.tag)
+                updatedChild = updated.find(field.tag)
+                if originalChild is None or updatedChild is None:
+                    if originalChild is not updatedChild:
+                        return False
+                elif not attributeMatches(originalChild, updatedChild, field.name):
+                    return False
+            elif isinstance(field, schema.ChildList):
+                originalItems = set([ e.text for e in original.findall(field.tag + '/' + field.itemTag) ])
+                updatedItems = set([ e.text for e in updated.findall(field.tag + '/' + field.itemTag) ])
+                if originalItems != updatedItems:
+                    return False
+    return True
 
-def getSignalmastBySystemName(root, systemName):
-    queryString = ".signalmasts/signalmast/systemName[.='%s']/.." % systemName
-    signalheads = root.findall(queryString)
-    if len(signalheads) != 1:
-        return None
-    else:
-        return signalheads[0]
-    
-def getReporterBySystemName(root, systemName):
-    queryString = ".reporters/reporter/systemName[.='%s']/.." % systemName
-    reporters = root.findall(queryString)
-    if len(reporters) != 1:
-        return None
-    else:
-        return reporters[0]
+# Index the objects of a section of one tree by system name, so that each
+# object is looked up in constant time. A system name that is not unique maps
+# to None, as the object cannot be matched up.
+def indexBySystemName(elements):
+    index = {}
+    for element in elements:
+        systemName = element.findtext('systemName')
+        index[systemName] = None if systemName in index else element
+    return index
 
 def getAllSensors(root):
     queryString = '.sensors/sensor'
@@ -122,11 +118,7 @@ def getAllReporters(root):
     return root.findall(queryString)
 
 def sensorMatches(original, updated):
-    if not attributeMatches(original, updated, 'inverted'):
-        return False
-    if not optionalTagMatches(original, updated, 'userName'):
-        return False
-    return optionalTagMatches(original, updated, 'comment')
+    return columnsMatch(original, updated, schema.sensorSchema)
 
 def sensorsMatch(originalRoot, updatedRoot):
     originalSensors = getAllSensors(originalRoot)
@@ -143,10 +135,11 @@ def sensorsMatch(originalRoot, updatedRoot):
         print(difference)
         return False
     print('Num sensors matches', len(originalSensors))
+    updatedByName = indexBySystemName(updatedSensors)
     for originalSensor in originalSensors:
         originalSystemName = originalSensor.find('systemName').text
         print('Checking sensor ', originalSystemName)
-        updatedSensor = getSensorBySystemName(updatedRoot, originalSystemName)
+        updatedSensor = updatedByName.get(originalSystemName)
         if updatedSensor == None:
             print('Error missing sensor in update: ', originalSystemName)
             return False
@@ -156,28 +149,7 @@ def sensorsMatch(originalRoot, updatedRoot):
     return True
 
 def turnoutMatches(original, updated):
-    if not attributeMatches(original, updated, 'feedback'):
-        return False
-    if not attributeMatches(original, updated, 'inverted'):
-        return False
-    if not attributeMatches(original, updated, 'automate'):
-        return False
-    if not attributeMatches(original, updated, 'controlType'):
-        return False
-    if not attributeMatches(original, updated, 'sensor1'):
-        return False
-    if not attributeMatches(original, updated, 'sensor2'):
-        return False
-    if not optionalTagMatches(original, updated, 'userName'):
-        return False
-    if not optionalTagMatches(original, updated, 'comment'):
-        return False
-    if not optionalTagMatches(original, updated, 'divergingSpeed'):
-        return False
-    if not optionalTagMatches(original, updated, 'straightSpeed'):
-        return False
-    return True
-    
+    return columnsMatch(original, updated, schema.turnoutSchema)
 
 def turnoutsMatch(originalRoot, updatedRoot):
     originalTurnouts = getAllTurnouts(originalRoot)
@@ -186,10 +158,11 @@ def turnoutsMatch(originalRoot, updatedRoot):
         print('Number of turnouts do not match')
         return False
     print('Num turnouts matches', len(originalTurnouts))
+    updatedByName = indexBySystemName(updatedTurnouts)
     for originalTurnout in originalTurnouts:
         originalSystemName = originalTurnout.find('systemName').text
         print('Checking turnout', originalSystemName)
-        updatedTurnout = getTurnoutBySystemName(originalRoot, originalSystemName)
+        updatedTurnout = updatedByName.get(originalSystemName)
         if updatedTurnout == None:
             print('Missing updated turnout')
             return False
@@ -199,41 +172,10 @@ def turnoutsMatch(originalRoot, updatedRoot):
     return True
 
 def lightMatches(originalLight, updatedLight):
-    if not attributeMatches(originalLight, updatedLight, 'minIntensity'):
-        return False
-    if not attributeMatches(originalLight, updatedLight, 'maxIntensity'):
-        return False
-    if not attributeMatches(originalLight, updatedLight, 'transitionTime'):
-        return False
-    if not optionalTagMatches(originalLight, updatedLight, 'userName'):
-        return False
-    if not optionalTagMatches(originalLight, updatedLight, 'comment'):
-        return False
-    originalLightcontrol = originalLight.find('lightcontrol')
-    updatedLightcontrol = updatedLight.find('lightcontrol')
-    if originalLightcontrol is None:
-        if updatedLightcontrol is None:
-            pass
-        else:
-            return False
-    else:
-        if updatedLightcontrol is None:
-            return False
-        else:
-            if not attributeMatches(originalLightcontrol, updatedLightcontrol, 'controlType'):
-                return False
-            if not attributeMatches(originalLightcontrol, updatedLightcontrol, 'controlSensor'):
-                return False
-            if not attributeMatches(originalLightcontrol, updatedLightcontrol, 'sensorSense'):
-                return False
-    return True
+    return columnsMatch(originalLight, updatedLight, schema.lightSchema)
 
 def reporterMatches(originalReporter, updatedReporter):
-    if not optionalTagMatches(originalReporter, updatedReporter, 'userName'):
-        return False
-    if not optionalTagMatches(originalReporter, updatedReporter, 'comment'):
-        return False
-    return True
+    return columnsMatch(originalReporter, updatedReporter, schema.reporterSchema)
 
 def lightsMatch(originalRoot, updatedRoot):
     originalLights = getAllLights(originalRoot)
@@ -249,10 +191,11 @@ def lightsMatch(originalRoot, updatedRoot):
             print(e.find('systemName').text)
         return False
     print('Num lights matches', len(originalLights))
+    updatedByName = indexBySystemName(updatedLights)
     for originalLight in originalLights:
         originalSystemName = originalLight.find('systemName').text
         print('Checking light', originalSystemName)
-        updatedLight = getLightBySystemName(originalRoot, originalSystemName)
+        updatedLight = updatedByName.get(originalSystemName)
         if updatedLight == None:
             print('Missing updated light')
             return False
@@ -275,10 +218,11 @@ def reportersMatch(originalRoot, updatedRoot):
             print(e.find('systemName').text)
         return False
     print('Num reporters matches', len(originalReporters))
+    updatedByName = indexBySystemName(updatedReporters)
     for originalReporter in originalReporters:
         originalSystemName = originalReporter.find('systemName').text
         print('Checking reporter', originalSystemName)
-        updatedReporter = getReporterBySystemName(originalRoot, originalSystemName)
+        updatedReporter = updatedByName.get(originalSystemName)
         if updatedReporter == None:
             print('Missing updated reporter')
             return False
@@ -323,10 +267,11 @@ def signalHeadsMatch(originalRoot, updatedRoot):
             print(e.find('systemName').text)
         return False
     print('Num signalheads match', numOriginalSignalheads)
+    updatedByName = indexBySystemName(updatedSignalheads)
     for originalSignalhead in originalSignalheads:
         originalSystemName = originalSignalhead.find('systemName').text
         print('Checking signalhead', originalSystemName)
-        updatedSignalhead = getSignalheadBySystemName(originalRoot, originalSystemName)
+        updatedSignalhead = updatedByName.get(originalSystemName)
         if updatedSignalhead is None:
             print('Missing updated signalhead')
             return False
@@ -389,10 +334,11 @@ def signalmastsMatch(originalRoot, updatedRoot):
             print(e.find('systemName').text)
         return False
     print('Num signalheads match', numOriginalSignalmasts)
+    updatedByName = indexBySystemName(updatedSignalmasts)
     for originalSignalmast in originalSignalmasts:
         originalSystemName = originalSignalmast.find('systemName').text
         print('Checking signalmast', originalSystemName)
-        updatedSignalmast = getSignalmastBySystemName(originalRoot, originalSystemName)
+        updatedSignalmast = updatedByName.get(originalSystemName)
         if updatedSignalmast is None:
             print('Missing updated signalhead')
             return False
@@ -431,30 +377,31 @@ def blocksMatch(originalRoot, updatedRoot):
 
 def main(args):
     print('Original file: ', args.originalFile, 'Updated file:', args.updatedFile)
-    originalTree = ET.parse(args.originalFile)
-    originalRoot = originalTree.getroot()
-    updatedTree = ET.parse(args.updatedFile)
-    updatedRoot = updatedTree.getroot()
-    if not sensorsMatch(originalRoot, updatedRoot):
-        return
-    if not turnoutsMatch(originalRoot, updatedRoot):
-        return
-    if not lightsMatch(originalRoot, updatedRoot):
-        return
-    if not reportersMatch(originalRoot, updatedRoot):
-        return
-    if not signalHeadsMatch(originalRoot, updatedRoot):
-        return
-    if not signalmastsMatch(originalRoot, updatedRoot):
-        return
-    if not blocksMatch(originalRoot, updatedRoot):
-        return
-    print('Test passed')
+    if args.xmlBackend:
+        xmlbackend.useBackend(args.xmlBackend)
+    profiling.enableIfRequested(profiler, args)
+    with profiler.phase('parse', args.originalFile):
+        originalTree = xmlbackend.parse(args.originalFile)
+        originalRoot = originalTree.getroot()
+    with profiler.phase('parse', args.updatedFile):
+        updatedTree = xmlbackend.parse(args.updatedFile)
+        updatedRoot = updatedTree.getroot()
+    for sectionsMatch in [ sensorsMatch, turnoutsMatch, lightsMatch, reportersMatch, signalHeadsMatch,
+            signalmastsMatch, blocksMatch ]:
+        with profiler.phase(sectionsMatch.__name__):
+            matched = sectionsMatch(originalRoot, updatedRoot)
+        if not matched:
+            break
+    else:
+        print('Test passed')
+    profiler.report(args)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Compare the original layout.xml with result of round trip through extract and compile')
     parser.add_argument('originalFile', type=str, help='JMRI layout description file in XML format')
     parser.add_argument('updatedFile', type=str, help='XML file result of running round trip extract followed by compile')
+    xmlbackend.addBackendArgument(parser)
+    profiling.addProfileArguments(parser)
     args = parser.parse_args()
 
     main(args)
\ No newline at end of file
@@ -0,0 +1,110 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Cross reference validation of the CSV files. The system and user names of
+# every object are indexed by object type in a single pass over the files, and
+# the columns that name other objects are then looked up in the indexes. The
+# names and references of each object type are described in schema.py.
+
+import csv
+import manifest
+
+# Returns the (column index, column) pairs of the columns of objectSchema that
+# name other objects. The indexes are into the CSV row, after the row kind.
+def referenceColumns(objectSchema):
+    return [ (i + 1, c) for (i, c) in enumerate(objectSchema.columns) if c.references is not None ]
+
+# Indexes of the objects of one type, from name to (file name, line number)
+class NameIndex:
+    def __init__(self):
+        self.systemNames = {}
+        self.userNames = {}
+
+    def __contains__(self, name):
+        return name in self.systemNames or name in self.userNames
+
+def location(fileName, lineNumber):
+    return '%s:%d' % (fileName, lineNumber)
+
+# A scan of one source file holds the names that it defines and refers to, and
+# the problems found in the file itself. It is made of lists, strings and
+# numbers, so that it can be kept as JSON. entries are, in file order,
+# [ 'name', line number, system name, user name ] for each object and
+# [ 'problem', line number, message ] for each problem. references are
+# [ line number, object type, name, column heading ].
+
+# reader yields the rows of the file and has the line number of the last row
+# in line_num, as a CSV reader does
+def scanRows(reader, schemas):
+    layouts = { rowKind: (len(s.columns) + 1, s.columnIndex('systemName') + 1,
+        s.columnIndex('userName') + 1, referenceColumns(s)) for (rowKind, s) in schemas.items() }
+    entries = []
+    references = []
+    try:
+        for row in reader:
+            if len(row) == 0 or row[0] not in layouts:
+                continue
+            lineNumber = reader.line_num
+            numColumns, systemNameIndex, userNameIndex, columns = layouts[row[0]]
+            if len(row) < numColumns:
+                entries.append([ 'problem', lineNumber, '%s row has %d columns, expected %d' % (row[0], len(row), numColumns) ])
+                continue
+            entries.append([ 'name', lineNumber, row[systemNameIndex], row[userNameIndex] ])
+            for (i, column) in columns:
+                if row[i] != '':
+                    references.append([ lineNumber, column.references, row[i], column.heading ])
+    except csv.Error as e:
+        entries.append([ 'problem', reader.line_num, str(e) ])
+    return { 'entries': entries, 'references': references }
+
+# Returns None if the file cannot be read. The file is read from tables
+# instead if it is given, as in manifest.openRows.
+def scanFile(fileName, schemas, tables=None):
+    try:
+        with manifest.openRows(fileName, tables) as reader:
+            return scanRows(reader, schemas)
+    except (OSError, KeyError):
+        return None
+
+# sources is a list of (object type, file name, schemas by row kind), and scans
+# the scan of each of the files. Files that cannot be read, whose scan is None,
+# are left out, since compile reports them when loading. Returns a list of
+# problems, each a string starting with the file name and line.
+def resolve(sources, scans):
+    problems = []
+    indexes = {}
+    references = [] # (object type, name, column heading, file name, line number)
+    for ((objectType, fileName, schemas), scan) in zip(sources, scans):
+        if scan is None:
+            continue
+        index = indexes.setdefault(objectType, NameIndex())
+        for entry in scan['entries']:
+            if entry[0] == 'problem':
+                problems.append('%s: %s' % (location(fileName, entry[1]), entry[2]))
+                continue
+            kind, lineNumber, systemName, userName = entry
+            if systemName in index.systemNames:
+                problems.append('%s: Duplicate %s system name %s, first defined at %s' %
+                    (location(fileName, lineNumber), objectType, systemName, location(*index.systemNames[systemName])))
+            else:
+                index.systemNames[systemName] = (fileName, lineNumber)
+            if userName != '':
+                if userName in index.userNames:
+                    problems.append('%s: Duplicate %s user name %s, first defined at %s' %
+                        (location(fileName, lineNumber), objectType, userName, location(*index.userNames[userName])))
+                else:
+                    index.userNames[userName] = (fileName, lineNumber)
+        for (lineNumber, referencedType, name, heading) in scan['references']:
+            references.append((referencedType, name, heading, fileName, lineNumber))
+
+    # JMRI looks up a reference by system name, and then by user name
+    for (objectType, name, heading, fileName, lineNumber) in references:
+        if name not in indexes.get(objectType, ()):
+            problems.append('%s: %s %s is not a known %s' % (location(fileName, lineNumber), heading, name, objectType))
+    return problems
+
+# Read and check all of the source files
+def validate(sources, tables=None):
+    return resolve(sources, [ scanFile(fileName, schemas, tables) for (objectType, fileName, schemas) in sources ])
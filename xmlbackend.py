@@ -0,0 +1,93 @@
+# Author Rangachari Anand Copyright (C) 2021
+# This is free software; you can redistribute it and/or modify it under the
+# terms of version 2 of the GNU General Public License as published by the Free
+# Software Foundation.
+
+# Parsing and serialization of layout files. lxml is used when it is installed,
+# since it parses and writes large layout files much faster than ElementTree.
+# Otherwise ElementTree is used. Both produce the same text, except that lxml
+# writes a carriage return in element text as &#13;, which ElementTree does not.
+
+import xml.etree.ElementTree as ET
+import compression
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+backend = 'lxml' if etree is not None else 'etree'
+
+def useBackend(name):
+    global backend
+    if name == 'lxml' and etree is None:
+        raise ImportError('lxml is not installed')
+    backend = name
+
+# Comments and processing instructions are dropped, as ElementTree does. The
+# source is a file name or a binary file object. A compressed file is
+# decompressed as it is parsed.
+def parse(source):
+    if isinstance(source, str) and compression.compressionOf(source) is not None:
+        with compression.openInput(source, 'rb') as inputFile:
+            return parseFile(inputFile)
+    return parseFile(source)
+
+def parseFile(source):
+    if backend == 'lxml':
+        parser = etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+        return etree.parse(source, parser)
+    return ET.parse(source)
+
+# Parse the top level elements of a layout one at a time, and yield each one
+# whose tag is in tags once its end tag has been read. The other elements are
+# dropped piece by piece as they are parsed, and a yielded element is dropped
+# once the caller has handled it, so the memory used is bounded by the largest
+# element yielded. The source is as for parse.
+def iterElements(source, tags):
+    if isinstance(source, str) and compression.compressionOf(source) is not None:
+        with compression.openInput(source, 'rb') as inputFile:
+            yield from iterFileElements(inputFile, tags)
+    else:
+        yield from iterFileElements(source, tags)
+
+def iterFileElements(source, tags):
+    if backend == 'lxml':
+        events = etree.iterparse(source, events=('start', 'end'), remove_comments=True, remove_pis=True, huge_tree=True)
+    else:
+        events = ET.iterparse(source, events=('start', 'end'))
+    path = [] # The open elements, from the root down
+    for (event, element) in events:
+        if event == 'start':
+            path.append(element)
+            continue
+        path.pop()
+        if len(path) == 1:
+            if element.tag in tags:
+                yield element
+            # A closed element is always the last child of its parent
+            del path[0][-1]
+        elif len(path) > 1 and path[1].tag not in tags:
+            del path[-1][-1]
+
+def Element(tag, attrib={}):
+    if backend == 'lxml':
+        return etree.Element(tag, attrib)
+    return ET.Element(tag, attrib)
+
+def indent(tree):
+    if backend == 'lxml':
+        etree.indent(tree, space='  ')
+    else:
+        ET.indent(tree)
+
+def tostring(element):
+    if backend == 'lxml':
+        text = etree.tostring(element, encoding='unicode')
+        # ElementTree writes a space before the end of an empty element and
+        # pads the character reference of a tab
+        return text.replace('/>', ' />').replace('&#9;', '&#09;')
+    return ET.tostring(element, encoding='unicode')
+
+def addBackendArgument(parser):
+    parser.add_argument('--xmlBackend', type=str, choices=[ 'lxml', 'etree' ], default=None,
+        help='XML library used to read and write the layout file. The default is lxml when it is installed.')